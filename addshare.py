@@ -1,17 +1,16 @@
 import os
 import sys
-import time
 import uvicorn
 import threading
-import numpy as np
-import pandas as pd
 import tensorflow as tf
 from server import Server
 from fastapi import FastAPI
 from timeit import default_timer as timer
 
 from helpers.utils import check_port, terminate_process_on_port, decode_layer, TimingCallback, encode_layer
-from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries, generate_additive_shares
+from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries
+from helpers.utils import generate_additive_shares, accumulate_share, wait_for_ports
+from helpers.metrics import MetricsWriter
 
 from helpers.constants import MESSAGE_FL_UPDATE, CLIENT_PORT, MESSAGE_MODEL_SHARE, MESSAGE_SHARING_COMPLETE
 from helpers.constants import EPOCHS, ADDRESS, SERVER_PORT, MESSAGE_START_TRAINING, MESSAGE_END_SESSION, SERVER_ID
@@ -36,12 +35,19 @@ class AddShareNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
 
         self.start_time = None
         self.secret_sharing_time = 0.0
 
         self.record = list()
 
+        # every round's record is appended to a log, which becomes the client csv at the end
+        current_dir = os.path.dirname(os.path.realpath(__file__))
+        output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
+        self.metrics = MetricsWriter(os.path.join(output_folder, f'client_{self.port - CLIENT_PORT}.jsonl'))
+        self.metrics.clear()
+
         self.round = 0
         self.current_accuracy = 0
         self.current_training_time = 0
@@ -85,7 +91,9 @@ class AddShareNode:
     def start_training(self, data):
 
         self.fl_nodes = [port for port in data["nodes"] if port != self.port]
-        self.round += 1
+        # the server's round, a resumed session does not start again from the first
+        self.round = data["round"]
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=0.001),
                            loss='categorical_crossentropy',
@@ -100,7 +108,7 @@ class AddShareNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -119,9 +127,9 @@ class AddShareNode:
                 weight_shares = list(generate_additive_shares(layer.weights[0], shares))
                 bias_shares = list(generate_additive_shares(layer.weights[1], shares))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
@@ -129,7 +137,7 @@ class AddShareNode:
 
         self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -167,8 +175,9 @@ class AddShareNode:
         self.start_time = timer()
         for layer in data.keys():
             weight_bias = decode_layer(data[layer])
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
         self.share_count += 1
 
@@ -188,8 +197,8 @@ class AddShareNode:
 
         for layer in self.own_shares.keys():
             temp_weight_bias = [None, None]
-            temp_weight_bias[0] = np.sum((self.own_shares[layer][0]), axis=0)
-            temp_weight_bias[1] = np.sum((self.own_shares[layer][1]), axis=0)
+            temp_weight_bias[0] = self.own_shares[layer][0]
+            temp_weight_bias[1] = self.own_shares[layer][1]
             layer_weights[layer] = encode_layer(temp_weight_bias)
 
         self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
@@ -200,14 +209,7 @@ class AddShareNode:
             'training': self.current_training_time,
             'secret_sharing': self.secret_sharing_time
         })
-
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
-        os.makedirs(output_folder, exist_ok=True)
-        csv_filename = f'client_{self.port - CLIENT_PORT}.csv'
-        csv_path = os.path.join(output_folder, csv_filename)
-        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
-
+        self.metrics.write(self.record[-1])
 
         data = {
             "port": self.port,
@@ -227,7 +229,7 @@ class AddShareNode:
         os.makedirs(output_folder, exist_ok=True)
         csv_filename = f'client_{self.port - CLIENT_PORT}.csv'
         csv_path = os.path.join(output_folder, csv_filename)
-        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
+        self.metrics.export(csv_path)
 
 
 if __name__ == "__main__":
@@ -282,11 +284,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
@@ -1,11 +1,8 @@
 import os
 import sys
-import time
 import json
 import uvicorn
 import threading
-import numpy as np
-import pandas as pd
 import tensorflow as tf
 from server import Server
 from fastapi import FastAPI
@@ -13,9 +10,10 @@ from timeit import default_timer as timer
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 
-from helpers.utils import NumpyEncoder, get_public_key, get_private_key, NumpyDecoder
+from helpers.utils import NumpyEncoder, get_public_key, get_private_key, NumpyDecoder, accumulate_share, wait_for_ports
 from helpers.utils import check_port, terminate_process_on_port, decode_layer, TimingCallback, encode_layer
 from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries, generate_additive_shares
+from helpers.metrics import MetricsWriter, read_metrics
 
 from helpers.constants import EPOCHS, ADDRESS, SERVER_PORT, MESSAGE_START_TRAINING, MESSAGE_END_SESSION, SERVER_ID
 from helpers.constants import MESSAGE_START_ASSEMBLY, NODES, MESSAGE_START_SECRET_SHARING, MESSAGE_TRAINING_COMPLETED
@@ -40,12 +38,16 @@ class AddShareNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
 
         self.start_time = None
         self.secret_sharing_time = 0.0
 
         self.record = list()
 
+        # every round's record is appended to a log, which becomes the client csv at the end
+        self.metrics = MetricsWriter(os.path.join(self.get_output_folder(), f'client_{self.port - CLIENT_PORT}.jsonl'))
+
         self.fresh_start = True
 
         self.round = 0
@@ -93,23 +95,30 @@ class AddShareNode:
 
     def check_current_round(self):
         output_folder = self.get_output_folder()
-        csv_filename = f'client_{self.port - CLIENT_PORT}.csv'
-        csv_path = os.path.join(output_folder, csv_filename)
+        model_filename = f'client_{self.port - CLIENT_PORT}.h5'
+        model_path = os.path.join(output_folder, model_filename)
+        client_records = read_metrics(self.metrics.path)
 
-        if os.path.exists(csv_path):
-            client_records = pd.read_csv(csv_path)
-            self.round = client_records['round'].max()
-            self.record = client_records.to_dict('records')
+        if client_records and os.path.exists(model_path):
+            self.round = max(record['round'] for record in client_records)
+            self.record = client_records
 
             self.fresh_start = False
             print("CHECKING IF THE ROUND IS INCOMPLETE")
         else:
             self.round = 0
+            self.metrics.clear()
 
     def start_training(self, data):
         print(f"FRESH START: {self.fresh_start}")
         self.fl_nodes = [port for port in data["nodes"] if port != self.port]
-        self.round += 1
+        # the server's round, a resumed session does not start again from the first
+        self.round = data["round"]
+        if self.record and self.record[-1]['round'] >= self.round:
+            # the rounds the server runs again are recorded again
+            self.record = [record for record in self.record if record['round'] < self.round]
+            self.metrics.rewrite(self.record)
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=0.001),
                            loss='categorical_crossentropy',
@@ -130,7 +139,7 @@ class AddShareNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -149,9 +158,9 @@ class AddShareNode:
                 weight_shares = list(generate_additive_shares(layer.weights[0], shares))
                 bias_shares = list(generate_additive_shares(layer.weights[1], shares))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
@@ -159,7 +168,7 @@ class AddShareNode:
 
         self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -243,8 +252,9 @@ class AddShareNode:
 
         for layer in data.keys():
             weight_bias = data[layer]
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
         self.share_count += 1
 
@@ -264,8 +274,8 @@ class AddShareNode:
 
         for layer in self.own_shares.keys():
             temp_weight_bias = [None, None]
-            temp_weight_bias[0] = np.sum((self.own_shares[layer][0]), axis=0)
-            temp_weight_bias[1] = np.sum((self.own_shares[layer][1]), axis=0)
+            temp_weight_bias[0] = self.own_shares[layer][0]
+            temp_weight_bias[1] = self.own_shares[layer][1]
             layer_weights[layer] = encode_layer(temp_weight_bias)
 
         self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
@@ -277,13 +287,11 @@ class AddShareNode:
             'secret_sharing': self.secret_sharing_time
         })
 
+        self.metrics.write(self.record[-1])
+
         output_folder = self.get_output_folder()
         os.makedirs(output_folder, exist_ok=True)
 
-        csv_filename = f'client_{self.port - CLIENT_PORT}.csv'
-        csv_path = os.path.join(output_folder, csv_filename)
-        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
-
         model_filename = f'client_{self.port - CLIENT_PORT}.h5'
         model_path = os.path.join(output_folder, model_filename)
         self.model.save(model_path)
@@ -299,6 +307,12 @@ class AddShareNode:
         model_weights = decode_layer(data['model_weights'])
         self.model.set_weights(model_weights)
 
+        csv_filename = f'client_{self.port - CLIENT_PORT}.csv'
+        csv_path = os.path.join(self.get_output_folder(), csv_filename)
+
+        # the session is over, a later run starts fresh instead of resuming from the log
+        self.metrics.export(csv_path)
+
     def get_output_folder(self):
         current_dir = os.path.dirname(os.path.realpath(__file__))
         output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
@@ -357,11 +371,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
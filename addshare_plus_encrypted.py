@@ -1,7 +1,6 @@
 import json
 import os
 import sys
-import time
 import uvicorn
 import threading
 import numpy as np
@@ -13,13 +12,13 @@ from cryptography.hazmat.primitives import hashes
 from server_addshare_plus import ServerAddsharePlus
 from cryptography.hazmat.primitives.asymmetric import padding
 
-from helpers.utils import NumpyEncoder, get_public_key, get_private_key, NumpyDecoder
+from helpers.utils import NumpyEncoder, get_public_key, get_private_key, NumpyDecoder, accumulate_share, wait_for_ports
 from helpers.utils import check_port, terminate_process_on_port, decode_layer, TimingCallback, encode_layer
 from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries, generate_additive_shares
 
 from helpers.constants import EPOCHS, ADDRESS, SERVER_PORT, MESSAGE_START_TRAINING, MESSAGE_END_SESSION, SERVER_ID
-from helpers.constants import MESSAGE_START_ASSEMBLY, NODES, MESSAGE_START_SECRET_SHARING, MESSAGE_TRAINING_COMPLETED
-from helpers.constants import MESSAGE_FL_UPDATE, CLIENT_PORT, MESSAGE_MODEL_SHARE, MESSAGE_SHARING_COMPLETE, CHUNK_SIZE
+from helpers.constants import NODES, MESSAGE_START_SECRET_SHARING, MESSAGE_TRAINING_COMPLETED
+from helpers.constants import MESSAGE_FL_UPDATE, CLIENT_PORT, MESSAGE_MODEL_SHARE, CHUNK_SIZE
 
 
 class AddSharePlusNode:
@@ -42,6 +41,7 @@ class AddSharePlusNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
 
         self.start_time = None
         self.secret_sharing_time = 0.0
@@ -71,9 +71,6 @@ class AddSharePlusNode:
             elif data["message"] == MESSAGE_MODEL_SHARE:
                 self.accept_shares(data['model_share'])
 
-            elif data["message"] == MESSAGE_START_ASSEMBLY:
-                self.reassemble_shares()
-
             return {"status": "ok"}
 
     def start(self):
@@ -94,7 +91,9 @@ class AddSharePlusNode:
 
         self.fl_nodes = [port for port in data["nodes"] if port != self.port]
         self.indexes = json.loads(data["indexes"])
-        self.round += 1
+        # the server's round, a resumed session does not start again from the first
+        self.round = data["round"]
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=0.001),
                            loss='categorical_crossentropy',
@@ -109,7 +108,7 @@ class AddSharePlusNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -137,17 +136,18 @@ class AddSharePlusNode:
                 weight_shares = list(generate_additive_shares(selected_kernels, NODES))
                 bias_shares = list(generate_additive_shares(selected_bias, NODES))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
                 self.other_shares[layer.name][1] = bias_shares
 
-        self.share_count += 1
+        with self.share_lock:
+            self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -199,13 +199,7 @@ class AddSharePlusNode:
 
         self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
 
-        if self.share_count == int(len(self.fl_nodes) + 1):
-            self.share_count = 0
-            data = {
-                "port": self.port,
-                "message": MESSAGE_SHARING_COMPLETE,
-            }
-            self.send_to_node(data=data, address=ADDRESS, port=SERVER_PORT)
+        self.check_sharing_complete()
 
     def accept_shares(self, data):
         self.start_time = timer()
@@ -231,28 +225,35 @@ class AddSharePlusNode:
 
         for layer in data.keys():
             weight_bias = data[layer]
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
-        self.share_count += 1
+        with self.share_lock:
+            self.share_count += 1
 
         self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
 
-        if self.share_count == int(len(self.fl_nodes) + 1):
-            self.share_count = 0
-            data = {
-                "port": self.port,
-                "message": MESSAGE_SHARING_COMPLETE,
-            }
-            self.send_to_node(data=data, address=ADDRESS, port=SERVER_PORT)
+        self.check_sharing_complete()
+
+    def check_sharing_complete(self):
+        # every share has arrived, so the node reassembles without a START_ASSEMBLY round trip to the server
+        with self.share_lock:
+            shares = self.share_count
+            complete = shares >= int(len(self.fl_nodes) + 1)
+            if complete:
+                self.share_count = 0
+
+        if complete:
+            self.reassemble_shares(shares)
 
-    def reassemble_shares(self):
+    def reassemble_shares(self, shares):
         self.start_time = timer()
         layer_weights = dict()
 
         for layer in self.own_shares.keys():
-            kernel = np.sum((self.own_shares[layer][0]), axis=0)
-            bias = np.sum((self.own_shares[layer][1]), axis=0)
+            kernel = self.own_shares[layer][0]
+            bias = self.own_shares[layer][1]
 
             selected_kernel_index = tuple(np.array(li) for li in self.indexes[layer][0])
             selected_bias_index = tuple(np.array(li) for li in self.indexes[layer][1])
@@ -281,6 +282,7 @@ class AddSharePlusNode:
             "port": self.port,
             "message": MESSAGE_FL_UPDATE,
             "model_weights": layer_weights,
+            "shares": shares,
         }
         self.send_to_node(address=ADDRESS, port=SERVER_PORT, data=data)
 
@@ -373,11 +375,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
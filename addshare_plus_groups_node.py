@@ -1,8 +1,6 @@
 import json
 import os
 import sys
-import time
-import random
 import uvicorn
 import threading
 import numpy as np
@@ -13,7 +11,8 @@ from timeit import default_timer as timer
 from server_addshare_plus_node_group import ServerAddsharePlusNodeSubGroup
 
 from helpers.utils import check_port, terminate_process_on_port, decode_layer, TimingCallback, encode_layer
-from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries, generate_additive_shares
+from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries
+from helpers.utils import generate_additive_shares, accumulate_share, wait_for_ports
 
 from helpers.constants import MESSAGE_FL_UPDATE, CLIENT_PORT, MESSAGE_MODEL_SHARE, MESSAGE_SHARING_COMPLETE
 from helpers.constants import EPOCHS, ADDRESS, SERVER_PORT, MESSAGE_START_TRAINING, MESSAGE_END_SESSION, SERVER_ID
@@ -41,6 +40,7 @@ class AddSharePlusNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
 
         self.start_time = None
         self.secret_sharing_time = 0.0
@@ -89,10 +89,11 @@ class AddSharePlusNode:
 
     def start_training(self, data):
 
-        all_nodes = [port for port in data["nodes"] if port != self.port]
-        self.fl_nodes = random.sample(all_nodes, self.group_size - 1)
+        # the server sends every node the members of its own group, so groups share symmetrically
+        self.fl_nodes = [port for port in data["nodes"] if port != self.port]
         self.indexes = json.loads(data["indexes"])
         self.round += 1
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=0.001),
                            loss='categorical_crossentropy',
@@ -107,7 +108,7 @@ class AddSharePlusNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -135,9 +136,9 @@ class AddSharePlusNode:
                 weight_shares = list(generate_additive_shares(selected_kernels, shares))
                 bias_shares = list(generate_additive_shares(selected_bias, shares))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
@@ -145,7 +146,7 @@ class AddSharePlusNode:
 
         self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -182,8 +183,9 @@ class AddSharePlusNode:
         self.start_time = timer()
         for layer in data.keys():
             weight_bias = decode_layer(data[layer])
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
         self.share_count += 1
 
@@ -202,8 +204,8 @@ class AddSharePlusNode:
         layer_weights = dict()
 
         for layer in self.own_shares.keys():
-            kernel = np.sum((self.own_shares[layer][0]), axis=0)
-            bias = np.sum((self.own_shares[layer][1]), axis=0)
+            kernel = self.own_shares[layer][0]
+            bias = self.own_shares[layer][1]
 
             selected_kernel_index = tuple(np.array(li) for li in self.indexes[layer][0])
             selected_bias_index = tuple(np.array(li) for li in self.indexes[layer][1])
@@ -326,11 +328,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
@@ -1,7 +1,6 @@
 import os
 import sys
 import json
-import time
 import uvicorn
 import threading
 import numpy as np
@@ -13,7 +12,7 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from server_addshare_plus_groups import ServerAddsharePlusSubGroup
 
-from helpers.utils import get_private_key, get_public_key, NumpyEncoder, NumpyDecoder
+from helpers.utils import get_private_key, get_public_key, NumpyEncoder, NumpyDecoder, accumulate_share, wait_for_ports
 from helpers.utils import check_port, terminate_process_on_port, decode_layer, TimingCallback, encode_layer
 from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries, generate_additive_shares
 
@@ -43,6 +42,11 @@ class AddSharePlusNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
+
+        self.aggregator = SERVER_PORT
+        self.group_updates = dict()
+        self.group_update_count = 0
 
         self.start_time = None
         self.secret_sharing_time = 0.0
@@ -69,6 +73,9 @@ class AddSharePlusNode:
             elif data["message"] == MESSAGE_END_SESSION:
                 self.end_session(data)
 
+            elif data["message"] == MESSAGE_FL_UPDATE:
+                self.accept_update(data['model_weights'])
+
             elif data["message"] == MESSAGE_MODEL_SHARE:
                 self.accept_shares(data['model_share'])
 
@@ -94,8 +101,10 @@ class AddSharePlusNode:
     def start_training(self, data):
 
         self.fl_nodes = [port for port in data["nodes"] if port != self.port]
+        self.aggregator = data.get("aggregator", SERVER_PORT)
         self.indexes = json.loads(data["indexes"])
         self.round += 1
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=0.001),
                            loss='categorical_crossentropy',
@@ -110,7 +119,7 @@ class AddSharePlusNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -138,9 +147,9 @@ class AddSharePlusNode:
                 weight_shares = list(generate_additive_shares(selected_kernels, shares))
                 bias_shares = list(generate_additive_shares(selected_bias, shares))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
@@ -148,7 +157,7 @@ class AddSharePlusNode:
 
         self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -232,8 +241,9 @@ class AddSharePlusNode:
 
         for layer in data.keys():
             weight_bias = data[layer]
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
         self.share_count += 1
 
@@ -252,8 +262,8 @@ class AddSharePlusNode:
         layer_weights = dict()
 
         for layer in self.own_shares.keys():
-            kernel = np.sum((self.own_shares[layer][0]), axis=0)
-            bias = np.sum((self.own_shares[layer][1]), axis=0)
+            kernel = self.own_shares[layer][0]
+            bias = self.own_shares[layer][1]
 
             selected_kernel_index = tuple(np.array(li) for li in self.indexes[layer][0])
             selected_bias_index = tuple(np.array(li) for li in self.indexes[layer][1])
@@ -278,12 +288,38 @@ class AddSharePlusNode:
             'secret_sharing': self.secret_sharing_time
         })
 
-        data = {
-            "port": self.port,
-            "message": MESSAGE_FL_UPDATE,
-            "model_weights": layer_weights,
-        }
-        self.send_to_node(address=ADDRESS, port=SERVER_PORT, data=data)
+        if self.aggregator == self.port:
+            self.accept_update(layer_weights)
+        else:
+            data = {
+                "port": self.port,
+                "message": MESSAGE_FL_UPDATE,
+                "model_weights": layer_weights,
+            }
+            self.send_to_node(address=ADDRESS, port=self.aggregator, data=data)
+
+    def accept_update(self, model_weights):
+        # the group's aggregator sums its members' updates and sends the server a single partial sum
+        with self.share_lock:
+            for layer in model_weights.keys():
+                weight_bias = decode_layer(model_weights[layer])
+                totals = self.group_updates.get(layer, [None, None])
+                totals[0] = accumulate_share(totals[0], weight_bias[0])
+                totals[1] = accumulate_share(totals[1], weight_bias[1])
+                self.group_updates[layer] = totals
+
+            self.group_update_count += 1
+            complete = self.group_update_count == int(len(self.fl_nodes) + 1)
+            if complete:
+                group_updates, self.group_updates, self.group_update_count = self.group_updates, dict(), 0
+
+        if complete:
+            data = {
+                "port": self.port,
+                "message": MESSAGE_FL_UPDATE,
+                "model_weights": {layer: encode_layer(weight_bias) for layer, weight_bias in group_updates.items()},
+            }
+            self.send_to_node(address=ADDRESS, port=SERVER_PORT, data=data)
 
     def send_updates(self):
         model_weights = dict()
@@ -377,11 +413,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
@@ -1,17 +1,15 @@
 import os
-import time
 import uvicorn
 import threading
-import numpy as np
-import pandas as pd
 import tensorflow as tf
 from fastapi import FastAPI
 from timeit import default_timer as timer
 
 from helpers import constants
 from area_x_server import AreaXAddsharePlusServer
-from helpers.utils import check_port, decode_layer, TimingCallback, encode_layer
+from helpers.utils import check_port, decode_layer, TimingCallback, encode_layer, accumulate_share, wait_for_ports
 from helpers.utils import post_with_retries, generate_additive_shares, get_area_x_dataset, terminate_process_on_port
+from helpers.metrics import MetricsWriter
 
 
 class AreaXAddShareNode:
@@ -32,6 +30,7 @@ class AreaXAddShareNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
 
         self.start_time = None
         self.secret_sharing_time = 0.0
@@ -39,6 +38,12 @@ class AreaXAddShareNode:
 
         self.record = list()
 
+        # every round's record is appended to a log, which becomes the client csv at the end
+        current_dir = os.path.dirname(os.path.realpath(__file__))
+        output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
+        self.metrics = MetricsWriter(os.path.join(output_folder, f'client_{self.port - constants.CLIENT_PORT}.jsonl'))
+        self.metrics.clear()
+
         self.round, self.mae, self.rmse, self.mape = 0, 0, 0, 0
         self.X_train, self.y_train, self.X_test, self.y_test = x_train, y_train, x_test, y_test
 
@@ -80,6 +85,7 @@ class AreaXAddShareNode:
 
         self.fl_nodes = [port for port in data["nodes"] if port != self.port]
         self.round += 1
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(
             optimizer=tf.keras.optimizers.Adam(learning_rate=0.01),
@@ -96,7 +102,7 @@ class AreaXAddShareNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -115,9 +121,9 @@ class AreaXAddShareNode:
                 weight_shares = list(generate_additive_shares(layer.weights[0], shares))
                 bias_shares = list(generate_additive_shares(layer.weights[1], shares))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
@@ -125,7 +131,7 @@ class AreaXAddShareNode:
 
         self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -163,8 +169,9 @@ class AreaXAddShareNode:
         self.start_time = timer()
         for layer in data.keys():
             weight_bias = decode_layer(data[layer])
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
         self.share_count += 1
 
@@ -184,8 +191,8 @@ class AreaXAddShareNode:
 
         for layer in self.own_shares.keys():
             temp_weight_bias = [None, None]
-            temp_weight_bias[0] = np.sum((self.own_shares[layer][0]), axis=0)
-            temp_weight_bias[1] = np.sum((self.own_shares[layer][1]), axis=0)
+            temp_weight_bias[0] = self.own_shares[layer][0]
+            temp_weight_bias[1] = self.own_shares[layer][1]
             layer_weights[layer] = encode_layer(temp_weight_bias)
 
         self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
@@ -198,13 +205,7 @@ class AreaXAddShareNode:
             'training': self.current_training_time,
             'secret_sharing': self.secret_sharing_time
         })
-
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
-        os.makedirs(output_folder, exist_ok=True)
-        csv_filename = f'client_{self.port - constants.CLIENT_PORT}.csv'
-        csv_path = os.path.join(output_folder, csv_filename)
-        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
+        self.metrics.write(self.record[-1])
 
         data = {
             "port": self.port,
@@ -224,7 +225,7 @@ class AreaXAddShareNode:
         os.makedirs(output_folder, exist_ok=True)
         csv_filename = f'client_{self.port - constants.CLIENT_PORT}.csv'
         csv_path = os.path.join(output_folder, csv_filename)
-        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
+        self.metrics.export(csv_path)
 
 
 if __name__ == "__main__":
@@ -267,11 +268,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
@@ -1,5 +1,4 @@
 import os
-import time
 import json
 import uvicorn
 import threading
@@ -11,8 +10,9 @@ from timeit import default_timer as timer
 
 from helpers import constants
 from area_x_server import AreaXAddsharePlusServer
-from helpers.utils import generate_additive_shares, post_with_retries, get_area_x_dataset
-from helpers.utils import check_port, terminate_process_on_port, TimingCallback, encode_layer, decode_layer
+from helpers.utils import generate_additive_shares, post_with_retries, get_area_x_dataset, accumulate_share
+from helpers.utils import check_port, terminate_process_on_port
+from helpers.utils import TimingCallback, encode_layer, decode_layer, wait_for_ports
 
 
 class AreaXAddSharePlusNode:
@@ -35,6 +35,7 @@ class AreaXAddSharePlusNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
 
         self.start_time = None
         self.secret_sharing_time = 0.0
@@ -82,6 +83,7 @@ class AreaXAddSharePlusNode:
         self.fl_nodes = [port for port in data["nodes"] if port != self.port]
         self.indexes = json.loads(data["indexes"])
         self.round += 1
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(
             optimizer=tf.keras.optimizers.Adam(learning_rate=0.01),
@@ -97,7 +99,7 @@ class AreaXAddSharePlusNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -125,9 +127,9 @@ class AreaXAddSharePlusNode:
                 weight_shares = list(generate_additive_shares(selected_kernels, NODES))
                 bias_shares = list(generate_additive_shares(selected_bias, NODES))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
@@ -135,7 +137,7 @@ class AreaXAddSharePlusNode:
 
         self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -173,8 +175,9 @@ class AreaXAddSharePlusNode:
         self.start_time = timer()
         for layer in data.keys():
             weight_bias = decode_layer(data[layer])
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
         self.share_count += 1
 
@@ -193,8 +196,8 @@ class AreaXAddSharePlusNode:
         layer_weights = dict()
 
         for layer in self.own_shares.keys():
-            kernel = np.sum((self.own_shares[layer][0]), axis=0)
-            bias = np.sum((self.own_shares[layer][1]), axis=0)
+            kernel = self.own_shares[layer][0]
+            bias = self.own_shares[layer][1]
 
             selected_kernel_index = tuple(np.array(li) for li in self.indexes[layer][0])
             selected_bias_index = tuple(np.array(li) for li in self.indexes[layer][1])
@@ -286,11 +289,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
@@ -1,6 +1,5 @@
 import os
 import sys
-import time
 import json
 import uvicorn
 import threading
@@ -14,7 +13,7 @@ from cryptography.hazmat.primitives import serialization
 
 from helpers import constants
 from area_x_server import AreaXAddsharePlusServer
-from helpers.utils import NumpyEncoder, get_public_key
+from helpers.utils import NumpyEncoder, get_public_key, accumulate_share, wait_for_ports
 from helpers.utils import decrypt_message_elliptical, encrypt_message_elliptical, encode_layer, NumpyDecoder
 from helpers.utils import check_port, terminate_process_on_port, decode_layer, TimingCallback, get_private_key
 from helpers.utils import fetch_dataset, fetch_index, get_area_x_dataset, post_with_retries, generate_additive_shares
@@ -40,6 +39,7 @@ class AreaXAddSharePlusNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
 
         self.start_time = None
         self.secret_sharing_time = 0.0
@@ -88,6 +88,7 @@ class AreaXAddSharePlusNode:
         self.fl_nodes = [port for port in data["nodes"] if port != self.port]
         self.indexes = json.loads(data["indexes"])
         self.round += 1
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(
             optimizer=tf.keras.optimizers.Adam(learning_rate=0.01),
@@ -103,7 +104,7 @@ class AreaXAddSharePlusNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -131,9 +132,9 @@ class AreaXAddSharePlusNode:
                 weight_shares = list(generate_additive_shares(selected_kernels, NODES))
                 bias_shares = list(generate_additive_shares(selected_bias, NODES))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
@@ -141,7 +142,7 @@ class AreaXAddSharePlusNode:
 
         self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -198,8 +199,9 @@ class AreaXAddSharePlusNode:
 
         for layer in data.keys():
             weight_bias = data[layer]
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
         self.share_count += 1
 
@@ -218,8 +220,8 @@ class AreaXAddSharePlusNode:
         layer_weights = dict()
 
         for layer in self.own_shares.keys():
-            kernel = np.sum((self.own_shares[layer][0]), axis=0)
-            bias = np.sum((self.own_shares[layer][1]), axis=0)
+            kernel = self.own_shares[layer][0]
+            bias = self.own_shares[layer][1]
 
             selected_kernel_index = tuple(np.array(li) for li in self.indexes[layer][0])
             selected_bias_index = tuple(np.array(li) for li in self.indexes[layer][1])
@@ -309,11 +311,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
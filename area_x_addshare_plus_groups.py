@@ -1,7 +1,6 @@
 import os
 import sys
 import json
-import time
 import uvicorn
 import threading
 import numpy as np
@@ -12,8 +11,9 @@ from timeit import default_timer as timer
 from area_x_server_groups import AreaXAddsharePlusServerGroups
 
 from helpers import constants
-from helpers.utils import get_dataset, post_with_retries, generate_additive_shares, get_area_x_dataset
-from helpers.utils import check_port, terminate_process_on_port, decode_layer, TimingCallback, encode_layer
+from helpers.utils import get_dataset, post_with_retries, generate_additive_shares, get_area_x_dataset, accumulate_share
+from helpers.utils import check_port, terminate_process_on_port
+from helpers.utils import decode_layer, TimingCallback, encode_layer, wait_for_ports
 
 
 class AreaXAddSharePlusGroupNode:
@@ -37,6 +37,7 @@ class AreaXAddSharePlusGroupNode:
 
         self.fl_nodes = list()
         self.share_count = 0
+        self.share_lock = threading.Lock()
 
         self.start_time = None
         self.secret_sharing_time = 0.0
@@ -85,6 +86,7 @@ class AreaXAddSharePlusGroupNode:
         self.fl_nodes = [port for port in data["nodes"] if port != self.port]
         self.indexes = json.loads(data["indexes"])
         self.round += 1
+        self.secret_sharing_time = 0.0
         self.model = tf.keras.models.model_from_json(data["model_architecture"])
         self.model.compile(
             optimizer=tf.keras.optimizers.Adam(learning_rate=0.01),
@@ -100,7 +102,7 @@ class AreaXAddSharePlusGroupNode:
 
         for layer in self.model.layers:
             if layer.trainable_weights:
-                self.own_shares[layer.name] = [[], []]
+                self.own_shares[layer.name] = [None, None]
                 self.other_shares[layer.name] = [None, None]
 
         data = {
@@ -128,9 +130,9 @@ class AreaXAddSharePlusGroupNode:
                 weight_shares = list(generate_additive_shares(selected_kernels, shares))
                 bias_shares = list(generate_additive_shares(selected_bias, shares))
 
-                self.own_shares[layer.name] = [[], []]
-                self.own_shares[layer.name][0].append(weight_shares.pop())
-                self.own_shares[layer.name][1].append(bias_shares.pop())
+                with self.share_lock:
+                    self.own_shares[layer.name][0] = accumulate_share(self.own_shares[layer.name][0], weight_shares.pop())
+                    self.own_shares[layer.name][1] = accumulate_share(self.own_shares[layer.name][1], bias_shares.pop())
 
                 self.other_shares[layer.name] = [None, None]
                 self.other_shares[layer.name][0] = weight_shares
@@ -138,7 +140,7 @@ class AreaXAddSharePlusGroupNode:
 
         self.share_count += 1
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
         self.start_exchanging_shares()
 
     def start_exchanging_shares(self):
@@ -176,8 +178,9 @@ class AreaXAddSharePlusGroupNode:
         self.start_time = timer()
         for layer in data.keys():
             weight_bias = decode_layer(data[layer])
-            self.own_shares[layer][0].append(weight_bias[0])
-            self.own_shares[layer][1].append(weight_bias[1])
+            with self.share_lock:
+                self.own_shares[layer][0] = accumulate_share(self.own_shares[layer][0], weight_bias[0])
+                self.own_shares[layer][1] = accumulate_share(self.own_shares[layer][1], weight_bias[1])
 
         self.share_count += 1
 
@@ -196,8 +199,8 @@ class AreaXAddSharePlusGroupNode:
         layer_weights = dict()
 
         for layer in self.own_shares.keys():
-            kernel = np.sum((self.own_shares[layer][0]), axis=0)
-            bias = np.sum((self.own_shares[layer][1]), axis=0)
+            kernel = self.own_shares[layer][0]
+            bias = self.own_shares[layer][1]
 
             selected_kernel_index = tuple(np.array(li) for li in self.indexes[layer][0])
             selected_bias_index = tuple(np.array(li) for li in self.indexes[layer][1])
@@ -292,11 +295,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
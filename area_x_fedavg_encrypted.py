@@ -1,6 +1,5 @@
 import os
 import sys
-import time
 import uvicorn
 import threading
 import pandas as pd
@@ -10,7 +9,7 @@ from fastapi import FastAPI
 from helpers import constants
 from area_x_server import AreaXAddsharePlusServer
 from helpers.utils import check_port, terminate_process_on_port, decode_layer, TimingCallback
-from helpers.utils import get_area_x_dataset, get_dataset, post_with_retries, encode_layer
+from helpers.utils import get_area_x_dataset, get_dataset, post_with_retries, encode_layer, wait_for_ports
 
 
 class AreaXFedAvg:
@@ -149,11 +148,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
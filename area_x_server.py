@@ -7,6 +7,7 @@ import tensorflow as tf
 from fastapi import FastAPI
 from timeit import default_timer as timer
 
+from helpers.barrier import RoundBarrier
 from helpers import constants
 from helpers.utils import random_weight_selection, magnitude_weight_selection, obd_weight_selection
 from helpers.utils import check_port, terminate_process_on_port, decode_layer, combine_find_mean_regression
@@ -25,14 +26,13 @@ class AreaXAddsharePlusServer:
 
         self.start_time = None
         self.end_time = None
-        self.pending_nodes = set()
         self.average_weights = dict()
         self.X, self.y = x, y
 
         self.global_model = get_regression_model()
         self.max_rounds = constants.ROUNDS
         self.round = 0
-        self.training_completed_count = 0
+        self.barrier = RoundBarrier()
         self.client_type = client_type
         self.pruning_type = pruning_type
         self.dataset = dataset
@@ -49,7 +49,7 @@ class AreaXAddsharePlusServer:
                 self.fl_update(data["port"], data["model_weights"])
 
             elif data["message"] == constants.MESSAGE_TRAINING_COMPLETED:
-                self.start_secret_sharing()
+                self.start_secret_sharing(data["port"])
 
             elif data["message"] == constants.MESSAGE_SHARING_COMPLETE:
                 self.start_assembly(data["port"])
@@ -86,7 +86,9 @@ class AreaXAddsharePlusServer:
 
         indexes = {}
         self.start_time = timer()
-        self.pending_nodes = self.nodes.copy()
+        self.barrier.reset()
+        self.barrier.open('training', self.nodes)
+        self.barrier.open('update', self.nodes)
         for layer in self.global_model.layers:
             if layer.trainable_weights:
                 if self.pruning_type == constants.RANDOM:
@@ -156,8 +158,7 @@ class AreaXAddsharePlusServer:
                 self.average_weights[layer][0] += temp_weight[0] / len(self.nodes)
                 self.average_weights[layer][1] += temp_weight[1] / len(self.nodes)
 
-        self.pending_nodes.remove(node)
-        if not self.pending_nodes:
+        if self.barrier.arrive('update', node):
             self.apply_updates()
 
     def apply_updates(self):
@@ -185,6 +186,7 @@ class AreaXAddsharePlusServer:
             'rmse': self.rmse,
             'mape': self.mape,
             'fl_time': self.end_time,
+            **self.barrier.latencies(),
         })
         self.end_round()
 
@@ -216,16 +218,16 @@ class AreaXAddsharePlusServer:
         terminate_process_on_port(self.port)
 
     def start_assembly(self, port):
+        self.barrier.arrive('sharing', port)
         data = {
             "port": "SERVER",
             "message": constants.MESSAGE_START_ASSEMBLY,
         }
         self.send_to_node(data, port=port)
 
-    def start_secret_sharing(self):
-        self.training_completed_count += 1
-        if self.training_completed_count == len(self.nodes):
-            self.training_completed_count = 0
+    def start_secret_sharing(self, port):
+        if self.barrier.arrive('training', port):
+            self.barrier.open('sharing', self.nodes)
             data = {
                 "port": "SERVER",
                 "message": constants.MESSAGE_START_SECRET_SHARING,
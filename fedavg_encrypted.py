@@ -1,6 +1,5 @@
 import os
 import sys
-import time
 import json
 import uvicorn
 import threading
@@ -13,7 +12,7 @@ from cryptography.hazmat.primitives.asymmetric import padding
 
 from helpers.utils import get_public_key, TimingCallback, NumpyEncoder
 from helpers.utils import check_port, terminate_process_on_port, decode_layer
-from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries, encode_layer
+from helpers.utils import fetch_dataset, fetch_index, get_dataset, post_with_retries, encode_layer, wait_for_ports
 
 from helpers.constants import CLIENT_PORT, SERVER_ID, NODES, MESSAGE_END_SESSION, EPOCHS, ADDRESS
 from helpers.constants import SERVER_PORT, MESSAGE_START_TRAINING, MESSAGE_FL_UPDATE_ENCRYPTED, CHUNK_SIZE
@@ -68,7 +67,8 @@ class FedAvgNode:
         )
 
     def start_training(self, global_model):
-        self.round += 1
+        # the server's round, a resumed session does not start again from the first
+        self.round = global_model["round"]
         self.model = tf.keras.models.model_from_json(global_model["model_architecture"])
         self.model.compile(optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=0.001),
                            loss='categorical_crossentropy',
@@ -193,11 +193,11 @@ if __name__ == "__main__":
 
     server_thread.start()
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(server.address, [server.port] + ports)
     server.start_round(ports)
 
     server_thread.join()
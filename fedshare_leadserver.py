@@ -7,14 +7,15 @@ import tensorflow as tf
 from fastapi import FastAPI
 from timeit import default_timer as timer
 
+from helpers.barrier import RoundBarrier
 from helpers.utils import check_port, terminate_process_on_port, get_dataset, combine_find_mean
 from helpers.utils import post_with_retries, encode_layer, decode_layer, get_lenet5_classification, get_private_key
 
-from helpers.constants import MESSAGE_START_TRAINING, ADDRESS, MESSAGE_FEDSHARE_SHARE, ROUNDS, MESSAGE_END_SESSION
+from helpers.constants import MESSAGE_START_TRAINING, ADDRESS, MESSAGE_FEDSHARE_SHARE, ROUNDS, MESSAGE_END_SESSION, STAR
 
 
 class FedShareLeadServer:
-    def __init__(self, address, port, client_type, dataset, indexes, x_train, y_train, x_test, y_test):
+    def __init__(self, address, port, client_type, dataset, indexes, x_train, y_train, x_test, y_test, topology=STAR):
         self.app = FastAPI()
         self.port = port
         self.address = address
@@ -23,7 +24,6 @@ class FedShareLeadServer:
 
         self.start_time = None
         self.end_time = None
-        self.pending_nodes = set()
         self.average_weights = dict()
         _, _, self.X_test, self.y_test = get_dataset(
             indexes[0],
@@ -37,14 +37,14 @@ class FedShareLeadServer:
         self.global_model = get_lenet5_classification(dataset)
         self.max_rounds = ROUNDS
         self.round = 0
-        self.training_completed_count = 0
+        self.barrier = RoundBarrier()
         self.client_type = client_type
         self.dataset = dataset
+        self.topology = topology
 
         self.record = list()
         self.current_accuracy = 0
         self.threshold = 0
-        self.share_count = 0
 
         self.shares = dict()
         self.servers = []
@@ -57,7 +57,7 @@ class FedShareLeadServer:
             print(f"SERVER RECEIVED: {data['message']} from PORT: {data['port']}")
 
             if data["message"] == MESSAGE_FEDSHARE_SHARE:
-                self.accept_shares(data["model_share"])
+                self.accept_shares(data["port"], data["model_share"])
 
             return {"status": "ok"}
 
@@ -91,7 +91,9 @@ class FedShareLeadServer:
             self.servers = servers
 
         self.start_time = timer()
-        self.pending_nodes = self.nodes.copy()
+        self.barrier.reset()
+        # a tree or ring sums the shares among the servers, only the first one sends the total
+        self.barrier.open('shares', self.servers if self.topology == STAR else self.servers[:1])
 
         for layer in self.global_model.layers:
             if layer.trainable_weights:
@@ -107,16 +109,13 @@ class FedShareLeadServer:
         }
         self.send_to_node(data)
 
-    def accept_shares(self, data):
+    def accept_shares(self, port, data):
         for layer in data.keys():
             weight_bias = decode_layer(data[layer])
             self.shares[layer][0].append(weight_bias[0])
             self.shares[layer][1].append(weight_bias[1])
 
-        self.share_count += 1
-
-        if self.share_count == len(self.servers):
-            self.share_count = 0
+        if self.barrier.arrive('shares', port):
             self.apply_updates()
 
     def apply_updates(self):
@@ -144,6 +143,7 @@ class FedShareLeadServer:
             'round': self.round + 1,
             'accuracy': self.current_accuracy,
             'fl': self.end_time,
+            **self.barrier.latencies(),
         })
 
         self.end_round()
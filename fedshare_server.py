@@ -9,13 +9,15 @@ from timeit import default_timer as timer
 
 from helpers.utils import check_port, terminate_process_on_port, get_dataset, combine_csv_files
 from helpers.utils import post_with_retries, encode_layer, decode_layer, get_lenet5_classification, get_private_key
+from helpers.topology import ShareAllReduce
 
 from helpers.constants import MESSAGE_FEDSHARE_SHARE, ADDRESS, MESSAGE_MODEL_SHARE, SERVER_PORT, ROUNDS
+from helpers.constants import MESSAGE_REDUCE_SHARE, STAR
 
 
 class FedShareServer:
     def __init__(self, address, port, max_nodes, client_type, dataset, indexes, x_train, y_train, x_test,
-                 y_test):
+                 y_test, servers=None, topology=STAR):
         self.app = FastAPI()
         self.port = port
         self.address = address
@@ -53,6 +55,14 @@ class FedShareServer:
 
         self.private_key = get_private_key('server')
 
+        # with a tree or ring the servers sum their shares into the first one, which sends the total
+        # to the lead server, otherwise every server sends its own share
+        self.servers = servers or [port]
+        self.reducer = None
+        if topology != STAR:
+            self.reducer = ShareAllReduce(self.port, self.servers, topology, self.send_to_node, self.reduced,
+                                          broadcast=False)
+
         @self.app.post("/message")
         def message(data: dict):
             print(f"SERVER RECEIVED: {data['message']} from PORT: {data['port']}")
@@ -60,6 +70,9 @@ class FedShareServer:
             if data["message"] == MESSAGE_MODEL_SHARE:
                 self.accept_shares(data["model_share"], data["data_size"])
 
+            elif data["message"] == MESSAGE_REDUCE_SHARE:
+                self.reducer.receive(data)
+
             return {"status": "ok"}
 
     def start(self):
@@ -114,10 +127,12 @@ class FedShareServer:
     def evaluate(self):
 
         model_weights = dict()
+        layer_weights = dict()
         for layer in self.global_model.layers:
             if layer.trainable_weights:
                 layer.set_weights(self.average_weights[layer.name])
                 model_weights[layer.name] = encode_layer(self.average_weights[layer.name])
+                layer_weights[layer.name] = self.average_weights[layer.name]
                 self.shares[layer.name] = [[], []]
                 self.average_weights[layer] = [None, None]
 
@@ -135,6 +150,10 @@ class FedShareServer:
             'fl': self.end_time,
         })
 
+        if self.reducer is not None:
+            self.reducer.reduce(layer_weights)
+            return
+
         data = {
             "port": self.port,
             "message": MESSAGE_FEDSHARE_SHARE,
@@ -142,6 +161,17 @@ class FedShareServer:
         }
         self.send_to_node(data, SERVER_PORT)
 
+    def reduced(self, layer_weights):
+        if self.port != self.servers[0]:
+            return
+
+        data = {
+            "port": self.port,
+            "message": MESSAGE_FEDSHARE_SHARE,
+            "model_share": {layer: encode_layer(weight_bias) for layer, weight_bias in layer_weights.items()},
+        }
+        self.send_to_node(data, SERVER_PORT)
+
     def disconnect(self):
         current_dir = os.path.dirname(os.path.realpath(__file__))
         output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
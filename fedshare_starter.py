@@ -1,27 +1,29 @@
 import sys
-import time
 import threading
 
 from fedshare import FedShareNode
 from fedshare_server import FedShareServer
 from fedshare_leadserver import FedShareLeadServer
 
-from helpers.utils import fetch_index, fetch_dataset, get_dataset
-from helpers.constants import ADDRESS, SERVER_PORT, NODES, CLIENT_PORT
+from helpers.utils import fetch_index, fetch_dataset, get_dataset, wait_for_ports
+from helpers.constants import ADDRESS, SERVER_PORT, NODES, CLIENT_PORT, STAR
 
 if __name__ == "__main__":
 
     DATASET = str(sys.argv[1])
     SERVERS = int(sys.argv[2])
+    TOPOLOGY = str(sys.argv[3]) if len(sys.argv) > 3 else STAR
 
     print(f"DATASET: {DATASET}")
     print(f"SERVERS: {SERVERS}")
+    print(f"TOPOLOGY: {TOPOLOGY}")
 
     indexes = fetch_index(DATASET)
     (x_train, y_train), (x_test, y_test) = fetch_dataset(DATASET)
 
     servers, nodes = [], []
-    server_ports, node_ports = [], []
+    server_ports = [SERVER_PORT + i for i in range(1, SERVERS + 1)]
+    node_ports = []
     threads = []
 
     # lead server
@@ -34,7 +36,8 @@ if __name__ == "__main__":
         x_train=x_train,
         y_train=y_train,
         x_test=x_test,
-        y_test=y_test
+        y_test=y_test,
+        topology=TOPOLOGY
     )
 
     # creating servers
@@ -49,10 +52,11 @@ if __name__ == "__main__":
             x_train=x_train,
             y_train=y_train,
             x_test=x_test,
-            y_test=y_test
+            y_test=y_test,
+            servers=server_ports,
+            topology=TOPOLOGY
         )
 
-        server_ports.append(SERVER_PORT + i)
         servers.append(server)
 
     # creating nodes
@@ -85,17 +89,16 @@ if __name__ == "__main__":
     threads.append(lead_server_thread)
 
     for server in servers:
-        time.sleep(2)
         t = threading.Thread(target=server.start)
         t.start()
         threads.append(t)
 
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start)
         t.start()
         threads.append(t)
 
+    wait_for_ports(ADDRESS, [SERVER_PORT] + server_ports + node_ports)
     lead_server.start_round(server_ports, node_ports)
 
     for t in threads:
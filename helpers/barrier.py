@@ -0,0 +1,134 @@
+import threading
+import numpy as np
+from collections import defaultdict
+from timeit import default_timer
+
+from helpers.constants import PHASE_TIMEOUT
+
+
+class RoundBarrier:
+    """
+    Tracks which participants have reached each phase of a round. Arrivals are counted once per
+    participant under a lock, so concurrent message handlers can neither lose nor repeat a phase
+    transition, and arrive returns True only for the arrival that completes the phase. A phase
+    opened with a quorum completes once that many members have arrived, the members that made it
+    are its cohort.
+
+    The time from opening a phase until it completes is kept per round and over the whole run.
+    A phase still open after the timeout reports the participants it is waiting for, and the tag
+    it was opened with, to on_timeout, which may end it early with complete.
+    """
+
+    def __init__(self, timeout=PHASE_TIMEOUT, on_timeout=None):
+        self.timeout = timeout
+        self.on_timeout = on_timeout or self.report_timeout
+        self.lock = threading.Lock()
+        self.phases = dict()
+        self.round_latencies = dict()
+        self.cohorts = dict()
+        self.history = defaultdict(list)
+
+    def open(self, phase, members, quorum=None, timeout=None, tag=None):
+        timeout = timeout or self.timeout
+        with self.lock:
+            self.cancel(phase)
+            self.cohorts.pop(phase, None)
+            state = {
+                'members': set(members),
+                'arrived': set(),
+                'quorum': len(members) if quorum is None else min(quorum, len(members)),
+                'start': default_timer(),
+                'tag': tag,
+                'timer': None,
+            }
+            if timeout:
+                state['timer'] = threading.Timer(timeout, self.expire, args=(phase, state))
+                state['timer'].daemon = True
+                state['timer'].start()
+
+            self.phases[phase] = state
+
+    def arrive(self, phase, member):
+        with self.lock:
+            state = self.phases.get(phase)
+            if state is None or member not in state['members']:
+                return False
+
+            state['arrived'].add(member)
+            if len(state['arrived']) < state['quorum']:
+                return False
+
+            self.finish(phase, state)
+            return True
+
+    def complete(self, phase):
+        # ends an open phase with the members that have arrived so far, None if nobody has
+        with self.lock:
+            state = self.phases.get(phase)
+            if state is None or not state['arrived']:
+                return None
+
+            self.finish(phase, state)
+            return self.cohorts[phase]
+
+    def finish(self, phase, state):
+        latency = default_timer() - state['start']
+        self.round_latencies[phase] = latency
+        self.history[phase].append(latency)
+        self.cohorts[phase] = set(state['arrived'])
+        self.cancel(phase)
+
+    def expects(self, phase, member):
+        with self.lock:
+            state = self.phases.get(phase)
+            return state is not None and member in state['members'] and member not in state['arrived']
+
+    def arrived(self, phase):
+        with self.lock:
+            state = self.phases.get(phase)
+            if state is None:
+                return set(self.cohorts.get(phase, set()))
+            return set(state['arrived'])
+
+    def cohort(self, phase):
+        return set(self.cohorts.get(phase, set()))
+
+    def missing(self, phase):
+        with self.lock:
+            state = self.phases.get(phase)
+            if state is None:
+                return set()
+            return state['members'] - state['arrived']
+
+    def cancel(self, phase):
+        state = self.phases.pop(phase, None)
+        if state is not None and state['timer'] is not None:
+            state['timer'].cancel()
+
+    def expire(self, phase, state):
+        with self.lock:
+            # the phase may have completed or been opened again since the timer started
+            if self.phases.get(phase) is not state:
+                return
+            missing = state['members'] - state['arrived']
+
+        if missing:
+            self.on_timeout(phase, missing, state['tag'])
+
+    def reset(self):
+        # a new round drops the phases and latencies of the last one
+        with self.lock:
+            for phase in list(self.phases):
+                self.cancel(phase)
+            self.round_latencies = dict()
+            self.cohorts = dict()
+
+    def latencies(self):
+        return {f'{phase}_phase': latency for phase, latency in self.round_latencies.items()}
+
+    def histogram(self, phase, bins=10):
+        return np.histogram(self.history[phase], bins=bins)
+
+    @staticmethod
+    def report_timeout(phase, missing, tag=None):
+        print(f"Phase {phase} timed out waiting for {sorted(missing, key=str)}")
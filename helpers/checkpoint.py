@@ -0,0 +1,81 @@
+import os
+import json
+import threading
+import numpy as np
+
+
+class RoundCheckpoint:
+    """
+    Keeps the global model and round state of a server in one .npz file so an interrupted run can
+    resume from its last completed round instead of from a freshly initialised model.
+
+    save copies the state and returns straight away, a background thread writes it to a temporary
+    file and moves it over the checkpoint, so a crash while writing leaves the previous checkpoint
+    intact. Only the newest state is written if rounds end faster than the disk keeps up.
+
+    Next to the weights it keeps the record of the last completed round and the selection indexes
+    picked for the next one, the earlier records are in the server's metrics log.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.condition = threading.Condition()
+        self.pending = None
+        self.writer = None
+
+    def save(self, round, weights, indexes=None, row=None):
+        state = {
+            'round': np.array(round),
+            'weights': np.array(len(weights)),
+            'indexes': np.array(json.dumps(indexes)),
+            'row': np.array(json.dumps(row, default=lambda value: value.item())),
+        }
+        for i, value in enumerate(weights):
+            state[f'weight_{i}'] = np.array(value, copy=True)
+
+        with self.condition:
+            self.pending = state
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.write, daemon=True)
+                self.writer.start()
+
+    def write(self):
+        while True:
+            with self.condition:
+                state, self.pending = self.pending, None
+                if state is None:
+                    self.writer = None
+                    self.condition.notify_all()
+                    return
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                np.savez(f, **state)
+            os.replace(temp_path, self.path)
+
+    def flush(self):
+        # waits for the last saved state to reach the disk
+        with self.condition:
+            while self.writer is not None:
+                self.condition.wait()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+
+        with np.load(self.path, allow_pickle=False) as checkpoint:
+            return {
+                'round': int(checkpoint['round']),
+                'weights': [checkpoint[f'weight_{i}'] for i in range(int(checkpoint['weights']))],
+                'indexes': json.loads(str(checkpoint['indexes'])),
+                'row': json.loads(str(checkpoint['row'])),
+            }
+
+
+def resume_record(checkpoint, rows):
+    # the log has the earlier rounds, the checkpoint the last one even if the log had not caught up
+    record = [row for row in rows if row['round'] < checkpoint['round']]
+    if checkpoint['row'] is not None:
+        record.append(checkpoint['row'])
+    return record
@@ -15,6 +15,15 @@ MESSAGE_FEDSHARE_SHARE = "FEDSHARE_SHARE"
 MESSAGE_SHARING_COMPLETE = "SHARING_COMPLETE"
 MESSAGE_START_ASSEMBLY = "START_ASSEMBLY"
 MESSAGE_ASSEMBLY_COMPLETED = "ASSEMBLY_COMPLETED"
+MESSAGE_NODE_DISCONNECTED = "NODE_DISCONNECTED"
+MESSAGE_SHARES_SENT = "SHARES_SENT"
+MESSAGE_PHASE_DEADLINE = "PHASE_DEADLINE"
+MESSAGE_REDUCE_SHARE = "REDUCE_SHARE"
+MESSAGE_MASK_SEED = "MASK_SEED"
+
+READY_TIMEOUT = 60
+PHASE_TIMEOUT = 600
+FRAME_SIZE = 1 << 20
 
 CHUNK_SIZE = 400
 BIT_SIZE = 4096
@@ -26,10 +35,15 @@ OBD = "obd"
 L1R = "l1"
 L2R = "l2"
 
+STAR = "star"
+TREE = "tree"
+RING = "ring"
+
 SERVERS = 2
 NODES = 50
 ROUNDS = 10
 EPOCHS = 2
 GROUPINGS = 2
+HIERARCHICAL = False
 DATASET = 'mnist'
 DATASETS = ['cifar-10', 'f-mnist', 'mnist', 'svhn']
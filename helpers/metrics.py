@@ -0,0 +1,91 @@
+import os
+import json
+import queue
+import threading
+import traceback
+import pandas as pd
+
+
+class MetricsWriter:
+    """
+    Appends records to a JSON lines file from a background thread, so a round never waits on the
+    disk. Records queued while a write is in progress go out together in the next one, and a
+    record is never rewritten once it is on disk. At the end of a session export turns the log into
+    the csv the results are combined from.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.writer = None
+
+    def write(self, record):
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.drain, daemon=True)
+                self.writer.start()
+        self.queue.put(dict(record))
+
+    def drain(self):
+        while True:
+            records = [self.queue.get()]
+            while True:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(lines(records))
+            except Exception:
+                # a failed write loses these records, but flush must not wait on them forever
+                print(f"Could not write {len(records)} records to {self.path}")
+                traceback.print_exc()
+            finally:
+                for _ in records:
+                    self.queue.task_done()
+
+    def flush(self):
+        # waits until every record written so far is on disk
+        self.queue.join()
+
+    def clear(self):
+        self.flush()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def rewrite(self, records):
+        # a resumed run replaces the log with the rounds it kept, the rounds it runs again are appended anew
+        self.flush()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(lines(records))
+        os.replace(temp_path, self.path)
+
+    def export(self, csv_path):
+        self.flush()
+        pd.DataFrame(read_metrics(self.path)).to_csv(csv_path, index=False, header=True)
+        self.clear()
+
+
+def lines(records):
+    return ''.join(json.dumps(record, default=lambda value: value.item()) + '\n' for record in records)
+
+
+def read_metrics(path):
+    if not os.path.exists(path):
+        return list()
+
+    records = list()
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # the last line of a run that was killed while writing
+                continue
+    return records
@@ -0,0 +1,59 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+AVERAGES = {
+    'accuracy': 'Average Accuracy',
+    'loss': 'Average Loss',
+    'rmse': 'Average RMSE',
+    'mape': 'Average MAPE',
+    'training': 'Average Training',
+    'secret_sharing': 'Average Secret Sharing',
+}
+CLASSIFICATION_METRICS = ['accuracy', 'training', 'secret_sharing']
+REGRESSION_METRICS = ['loss', 'rmse', 'mape', 'training', 'secret_sharing']
+PERCENTILES = [25, 50, 75]
+
+
+def client_values(df, metric):
+    # combined.csv has one column per client for each metric, read_csv numbers the repeats metric.1, metric.2, ...
+    pattern = re.compile(rf'{re.escape(metric)}(\.\d+)?')
+    mask = [bool(pattern.fullmatch(str(column))) for column in df.columns]
+    return df.loc[:, mask].to_numpy(dtype=np.float64)
+
+
+def average_clients(df, metrics):
+    # one mean over the clients for every round, computed for all rounds at once
+    for metric in metrics:
+        values = client_values(df, metric)
+        if values.shape[1]:
+            df[AVERAGES[metric]] = np.nanmean(values, axis=1)
+    return df
+
+
+def summarize_rounds(df, experiment, dataset, metrics):
+    summary = pd.DataFrame({
+        'experiment': experiment,
+        'dataset': dataset,
+        'round': df['round'].to_numpy() if 'round' in df else np.arange(1, len(df) + 1),
+    })
+    for metric in metrics:
+        values = client_values(df, metric)
+        if not values.shape[1]:
+            continue
+
+        summary[f'{metric}_mean'] = np.nanmean(values, axis=1)
+        summary[f'{metric}_std'] = np.nanstd(values, axis=1)
+        for percentile, column in zip(PERCENTILES, np.nanpercentile(values, PERCENTILES, axis=1)):
+            summary[f'{metric}_p{percentile}'] = column
+    return summary
+
+
+def write_summary(summaries, folder_path):
+    if not summaries:
+        return None
+
+    table = pd.concat(summaries, ignore_index=True)
+    table.to_csv(os.path.join(folder_path, 'summary.csv'), index=False)
+    return table
@@ -0,0 +1,55 @@
+import functools
+import threading
+from collections import defaultdict
+from timeit import default_timer
+
+
+class PhaseTimer:
+    """
+    Adds up the time spent in each phase of a round, e.g. training, encryption or send. A phase is
+    timed with a span, or with the timed decorator on a method of an object that has a timer.
+    Spans may run on several threads at once, collect returns the totals as <phase>_time columns
+    for the round's record and starts the next round from zero.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(float)
+
+    def span(self, phase):
+        return Span(self, phase)
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.totals[phase] += seconds
+
+    def collect(self):
+        with self.lock:
+            totals, self.totals = self.totals, defaultdict(float)
+        return {f'{phase}_time': seconds for phase, seconds in sorted(totals.items())}
+
+
+class Span:
+    def __init__(self, timer, phase):
+        self.timer = timer
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.phase, default_timer() - self.start)
+        return False
+
+
+def timed(phase):
+    # times every call of a method in the phase, on the timer of the object it is called on
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timer.span(phase):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
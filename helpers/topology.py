@@ -0,0 +1,176 @@
+import threading
+import numpy as np
+
+from helpers.utils import encode_layer, decode_layer
+from helpers.constants import MESSAGE_REDUCE_SHARE, RING
+
+
+class ShareAllReduce:
+    """
+    Sums the shares held by a set of servers so every server ends up with the total, without one
+    server receiving the share of every other.
+
+    tree sends partial sums up a binary tree of the servers and the total back down it, no server
+    handles more than three shares a round. ring runs a reduce-scatter and then an all-gather over
+    the flattened shares, every server sends and receives 2 (S - 1) / S of a share.
+
+    Messages that arrive before the server has its own share are held back until it does. Sending
+    happens outside the lock, since the servers send to each other from their message handlers.
+
+    With broadcast=False only the first server needs the total: tree sends no total back down and
+    ring sends every summed chunk straight to the first server instead of passing it round the ring.
+
+    Shares go on the wire with encode and are read back with decode, an endpoint passes its own
+    transport's encoding.
+    """
+
+    def __init__(self, port, servers, topology, send, on_total, broadcast=True, encode=encode_layer,
+                 decode=decode_layer):
+        self.port = port
+        self.servers = list(servers)
+        self.index = self.servers.index(port)
+        self.topology = topology
+        self.send = send
+        self.on_total = on_total
+        self.broadcast = broadcast
+        self.encode = encode
+        self.decode = decode
+        self.lock = threading.Lock()
+
+        self.layout = None
+        self.vector = None
+        self.chunks = None
+        self.pending = list()
+        self.reduced = 0
+        self.gathered = 0
+
+    def reduce(self, layer_weights):
+        with self.lock:
+            self.layout = [(layer, [np.shape(value) for value in values]) for layer, values in layer_weights.items()]
+            self.vector = np.concatenate([np.ravel(value) for values in layer_weights.values() for value in values])
+            self.vector = self.vector.astype(np.float64)
+            pending, self.pending = self.pending, list()
+
+            if len(self.servers) == 1:
+                messages, total, done = [], self.vector, True
+            elif self.topology == RING:
+                # every server starts the reduction of the chunk with its own index
+                self.chunks = np.array_split(self.vector, len(self.servers))
+                messages = [(self.next(), self.message('reduce', 0, self.index, self.chunks[self.index]))]
+                total, done = None, False
+            else:
+                messages, total, done = self.climb()
+            self.clear(done)
+
+        self.deliver(messages, total)
+        for data in pending:
+            self.receive(data)
+
+    def receive(self, data):
+        with self.lock:
+            if self.vector is None:
+                self.pending.append(data)
+                return
+
+            share = self.decode(data["model_share"])
+            if data["phase"] == 'up':
+                self.vector += share
+                self.reduced += 1
+                messages, total, done = self.climb()
+            elif data["phase"] == 'down':
+                messages, total, done = self.descend(share), share, True
+            elif data["phase"] == 'reduce':
+                messages, total, done = self.reduce_chunk(data["step"], data["index"], share)
+            else:
+                messages, total, done = self.gather_chunk(data["step"], data["index"], share)
+            self.clear(done)
+
+        self.deliver(messages, total)
+
+    def children(self):
+        return [self.servers[i] for i in (2 * self.index + 1, 2 * self.index + 2) if i < len(self.servers)]
+
+    def next(self):
+        return self.servers[(self.index + 1) % len(self.servers)]
+
+    def climb(self):
+        # a server passes its partial sum up once every child has sent its own
+        if self.reduced < len(self.children()):
+            return [], None, False
+        if self.index == 0:
+            return (self.descend(self.vector) if self.broadcast else []), self.vector, True
+        # without a broadcast the server has nothing left to do once its partial sum is sent
+        return [(self.servers[(self.index - 1) // 2], self.message('up', 0, 0, self.vector))], None, not self.broadcast
+
+    def descend(self, total):
+        return [(child, self.message('down', 0, 0, total)) for child in self.children()]
+
+    def reduce_chunk(self, step, index, chunk):
+        self.chunks[index] += chunk
+        self.reduced += 1
+        last_step = len(self.servers) - 2
+        if step < last_step:
+            messages = [(self.next(), self.message('reduce', step + 1, index, self.chunks[index]))]
+        elif self.broadcast:
+            # the chunk now holds the sum over every server, the all-gather passes it round the ring
+            messages = [(self.next(), self.message('gather', 0, index, self.chunks[index]))]
+        elif self.index != 0:
+            # or hands it straight to the first server, as the last step of a gather so it goes no further
+            messages = [(self.servers[0], self.message('gather', last_step, index, self.chunks[index]))]
+        else:
+            messages = []
+
+        if self.broadcast or self.index == 0:
+            total = self.ring_total()
+            return messages, total, total is not None
+        # the steps of different chunks may arrive in any order, a server is only done once every one has passed
+        return messages, None, self.reduced == len(self.servers) - 1
+
+    def gather_chunk(self, step, index, chunk):
+        self.chunks[index] = chunk
+        self.gathered += 1
+        messages = []
+        if step < len(self.servers) - 2:
+            messages.append((self.next(), self.message('gather', step + 1, index, chunk)))
+        total = self.ring_total()
+        return messages, total, total is not None
+
+    def ring_total(self):
+        if self.reduced < len(self.servers) - 1 or self.gathered < len(self.servers) - 1:
+            return None
+        return np.concatenate(self.chunks)
+
+    def message(self, phase, step, index, share):
+        return {
+            "port": self.port,
+            "message": MESSAGE_REDUCE_SHARE,
+            "phase": phase,
+            "step": step,
+            "index": index,
+            "model_share": self.encode(share),
+        }
+
+    def unflatten(self, vector):
+        layer_weights, start = dict(), 0
+        for layer, shapes in self.layout:
+            layer_weights[layer] = list()
+            for shape in shapes:
+                size = int(np.prod(shape))
+                layer_weights[layer].append(vector[start:start + size].reshape(shape))
+                start += size
+        return layer_weights
+
+    def clear(self, done):
+        # once the server's part is over the next round starts from nothing
+        if done:
+            self.vector = None
+            self.chunks = None
+            self.reduced = 0
+            self.gathered = 0
+
+    def deliver(self, messages, total):
+        for port, data in messages:
+            self.send(data, port)
+
+        if total is not None:
+            self.on_total(self.unflatten(total))
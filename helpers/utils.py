@@ -1,5 +1,6 @@
 import json
 import os
+import time
 import signal
 import random
 import pickle
@@ -7,7 +8,6 @@ import codecs
 import socket
 import logging
 import requests
-import itertools
 import numpy as np
 import pandas as pd
 from PIL import Image
@@ -22,6 +22,13 @@ from cryptography.hazmat.primitives.asymmetric import rsa, ec
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import serialization, hashes
 
+from helpers.constants import READY_TIMEOUT
+from helpers.results import average_clients, summarize_rounds, write_summary
+from helpers.results import CLASSIFICATION_METRICS, REGRESSION_METRICS
+
+
+DATASET_CACHE = dict()
+
 
 def post_with_retries(url, data, max_retries=3):
     session = requests.Session()
@@ -68,6 +75,25 @@ def terminate_process_on_port(port):
         print(f"Error terminating process on port {port}: {e}")
 
 
+def wait_for_ports(address, ports, timeout=READY_TIMEOUT):
+    # poll every pending port until its server accepts connections, so startup takes as long as the slowest server
+    pending = set(ports)
+    deadline = default_timer() + timeout
+
+    while pending:
+        for port in list(pending):
+            try:
+                socket.create_connection((address, port), timeout=0.1).close()
+                pending.discard(port)
+            except socket.error:
+                pass
+
+        if pending:
+            if default_timer() > deadline:
+                raise TimeoutError(f"Ports not ready after {timeout}s: {sorted(pending)}")
+            time.sleep(0.05)
+
+
 def fetch_index(dataset):
     current_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
     path = current_dir + f'/resources/dataset/{dataset}/iid_balanced.txt'
@@ -97,39 +123,39 @@ def fetch_dataset(dataset):
         return (x_train, y_train), (x_test, y_test)
 
 
-def get_dataset(index, dataset, x_train, y_train, x_test, y_test):
-    if dataset == "cifar-10":
-        x_train = x_train[index]
-        y_train = y_train[index]
-
-        x_train = x_train.astype('float32') / 255.0
-        x_test = x_test.astype('float32') / 255.0
+def sample_first(dataset, x):
+    # svhn images are stored as (32, 32, 3, samples)
+    if dataset == 'svhn':
+        return np.moveaxis(x, -1, 0)
+    return x
 
-        y_train = tf.keras.utils.to_categorical(y_train, 10)
-        y_test = tf.keras.utils.to_categorical(y_test, 10)
 
-    elif dataset == 'svhn':
-        x_train = np.moveaxis(x_train, -1, 0)
-        x_test = np.moveaxis(x_test, -1, 0)
+def normalize_images(dataset, x):
+    if dataset not in ["cifar-10", "svhn"]:
+        x = x.reshape(x.shape[0], 28, 28, 1)
+    return x.astype('float32') / 255.0
 
-        x_train = x_train[index]
-        y_train = y_train[index]
 
-        x_train = x_train.astype('float32') / 255.0
-        x_test = x_test.astype('float32') / 255.0
+def one_hot_labels(dataset, y):
+    # svhn labels run from 1 to 10
+    if dataset == 'svhn':
+        y = y - 1
+    return tf.keras.utils.to_categorical(y, 10)
 
-        y_train = tf.keras.utils.to_categorical((y_train - 1), 10)
-        y_test = tf.keras.utils.to_categorical((y_test - 1), 10)
 
-    else:
-        x_train = x_train[index]
-        y_train = y_train[index]
+def get_test_dataset(dataset, x_test, y_test):
+    # every node and server evaluates on the same test set, so it is only normalised once per dataset
+    cached = DATASET_CACHE.get(dataset)
+    if cached is None or cached[0] is not x_test:
+        cached = (x_test, normalize_images(dataset, sample_first(dataset, x_test)), one_hot_labels(dataset, y_test))
+        DATASET_CACHE[dataset] = cached
+    return cached[1], cached[2]
 
-        x_train = x_train.reshape(x_train.shape[0], 28, 28, 1).astype('float32') / 255.0
-        x_test = x_test.reshape(x_test.shape[0], 28, 28, 1).astype('float32') / 255.0
 
-        y_train = tf.keras.utils.to_categorical(y_train, 10)
-        y_test = tf.keras.utils.to_categorical(y_test, 10)
+def get_dataset(index, dataset, x_train, y_train, x_test, y_test):
+    x_train = normalize_images(dataset, sample_first(dataset, x_train)[index])
+    y_train = one_hot_labels(dataset, y_train[index])
+    x_test, y_test = get_test_dataset(dataset, x_test, y_test)
 
     return x_train, y_train, x_test, y_test
 
@@ -405,29 +431,22 @@ def iid_balanced(client_number, train_size, dataset):
 
 
 def generate_groups(nodes, group_size):
-    # shuffle clients
+    """
+    Splits the nodes at random into disjoint groups of at most group_size, using as few groups as
+    that allows, with sizes that differ by no more than one.
+    """
+    nodes = list(nodes)
     random.shuffle(nodes)
 
-    # Create a repeating iterator over the clients list
-    client_iterator = itertools.cycle(nodes)
-
-    # Keep track of which clients have been selected
-    selected_clients = set()
-
-    # Keep selecting groups of clients until each client has been selected at least once
-    selected_groups = []
-    while len(selected_clients) < len(nodes):
-        # Select the next group of clients
-        group = list(itertools.islice(client_iterator, group_size))
-
-        # Add the selected clients to the set of selected clients
-        selected_clients.update(group)
+    group_size = max(1, group_size)
+    count = max(1, (len(nodes) + group_size - 1) // group_size)
+    sizes = [len(nodes) // count + (1 if i < len(nodes) % count else 0) for i in range(count)]
 
-        # Add the selected group to the list of selected groups
-        selected_groups.append(group)
-
-    # All clients have been selected at least once
-    return selected_groups
+    groups, start = [], 0
+    for size in sizes:
+        groups.append(nodes[start:start + size])
+        start += size
+    return groups
 
 
 def get_public_key(client_id, encryption_type='rsa'):
@@ -523,6 +542,14 @@ def generate_additive_shares(value, n):
     return shares
 
 
+def accumulate_share(total, share):
+    # adds a share into the running sum in place, so only one array per weight is kept however many shares arrive
+    if total is None:
+        return np.array(share, dtype=np.float64)
+    np.add(total, share, out=total)
+    return total
+
+
 def random_weight_selection(weights, fraction):
     percentage = max(0, min(100, fraction))
     flattened_weights = weights.flatten()
@@ -582,15 +609,15 @@ def combine_csv_files(experiment, dataset):
         if file.startswith('client') and file.endswith('.csv'):  # Ensure that only CSV files are considered
             file_path = os.path.join(folder_path, file)
 
-            # Read the CSV file and append it to the list
+            # Read the CSV file and append it to the list, indexed by the round it belongs to
             df = pd.read_csv(file_path)
-            df = df.drop(columns='round')
+            df = df.set_index('round')
             data_frames.append(df)
 
-    # Concatenate all data frames into one
+    # Line the clients up by round, a client that sat a round out has no values in it
     if len(data_frames) != 0:
-        combined_df = pd.concat(data_frames, axis=1)
-        combined_df.to_csv(f"{folder_path}/combined.csv")
+        combined_df = pd.concat(data_frames, axis=1, join='outer').sort_index()
+        combined_df.to_csv(f"{folder_path}/combined.csv", index_label='round')
 
     for file in files:
         if file.startswith('client') and file.endswith('.csv'):
@@ -609,11 +636,7 @@ def combine_find_mean(experiment, dataset):
     csv_dir = os.path.join(folder_path, 'combined.csv')
 
     if os.path.exists(csv_dir):
-        df = pd.read_csv(csv_dir)
-        df['Average Accuracy'] = df.apply(lambda row: row['accuracy'].mean(), axis=1)
-        df['Average Training'] = df.apply(lambda row: row['training'].mean(), axis=1)
-        if 'secret_sharing' in df:
-            df['Average Secret Sharing'] = df.apply(lambda row: row['secret_sharing'].mean(), axis=1)
+        df = average_clients(pd.read_csv(csv_dir), CLASSIFICATION_METRICS)
         df.columns = df.columns.str.replace(r'\.\d+$', '', regex=True)
         df.to_csv(csv_dir, index=False)
 
@@ -627,13 +650,7 @@ def combine_find_mean_regression(experiment, dataset):
     csv_dir = os.path.join(folder_path, 'combined.csv')
 
     if os.path.exists(csv_dir):
-        df = pd.read_csv(csv_dir)
-        df['Average Loss'] = df.apply(lambda row: row['loss'].mean(), axis=1)
-        df['Average RMSE'] = df.apply(lambda row: row['rmse'].mean(), axis=1)
-        df['Average MAPE'] = df.apply(lambda row: row['mape'].mean(), axis=1)
-        df['Average Training'] = df.apply(lambda row: row['training'].mean(), axis=1)
-        if 'secret_sharing' in df:
-            df['Average Secret Sharing'] = df.apply(lambda row: row['secret_sharing'].mean(), axis=1)
+        df = average_clients(pd.read_csv(csv_dir), REGRESSION_METRICS)
         df.columns = df.columns.str.replace(r'\.\d+$', '', regex=True)
         df.to_csv(csv_dir, index=False)
 
@@ -663,22 +680,26 @@ def combine_find_mean_2():
     folder_path = parent_dir + f'/resources/results'
     datasets = ['cifar-10', 'f-mnist', 'mnist', 'svhn']
     folder_items = os.listdir(folder_path)
+    summaries = []
 
     for folder in folder_items:
+        if not os.path.isdir(os.path.join(folder_path, folder)):
+            continue
+
         for dataset in datasets:
             combine_csv_files(folder, dataset)
 
             csv_dir = os.path.join(folder_path, folder, dataset, 'combined.csv')
 
             if os.path.exists(csv_dir):
-                df = pd.read_csv(csv_dir)
-                df['Average Accuracy'] = df.apply(lambda row: row['accuracy'].mean(), axis=1)
-                df['Average Training'] = df.apply(lambda row: row['training'].mean(), axis=1)
-                if 'secret_sharing' in df:
-                    df['Average Secret Sharing'] = df.apply(lambda row: row['secret_sharing'].mean(), axis=1)
+                df = average_clients(pd.read_csv(csv_dir), CLASSIFICATION_METRICS)
+                summaries.append(summarize_rounds(df, folder, dataset, CLASSIFICATION_METRICS))
                 df.columns = df.columns.str.replace(r'\.\d+$', '', regex=True)
                 df.to_csv(csv_dir, index=False)
 
+    # per round mean, spread and percentiles over the clients of every experiment, in one table
+    write_summary(summaries, folder_path)
+
 
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from helpers.utils import fetch_dataset, sample_first, normalize_images, one_hot_labels
+
+
+class SharedDataset:
+    """
+    Saves the raw training images and the normalised test set once as .npy files which every
+    process memory-maps, so the test set is held once by the OS page cache instead of once per node.
+    Only the pickled name and folder are sent to worker processes.
+    """
+
+    def __init__(self, dataset, folder):
+        self.dataset = dataset
+        self.folder = folder
+        self.arrays = None
+
+    @classmethod
+    def create(cls, dataset):
+        folder = tempfile.mkdtemp(prefix=f'{dataset}_')
+        (x_train, y_train), (x_test, y_test) = fetch_dataset(dataset)
+
+        arrays = {
+            'x_train': sample_first(dataset, x_train),
+            'y_train': y_train,
+            'x_test': normalize_images(dataset, sample_first(dataset, x_test)),
+            'y_test': one_hot_labels(dataset, y_test),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(folder, f'{name}.npy'), array)
+
+        return cls(dataset, folder)
+
+    def __getstate__(self):
+        return {'dataset': self.dataset, 'folder': self.folder, 'arrays': None}
+
+    def load(self):
+        if self.arrays is None:
+            self.arrays = dict()
+            for name in ['x_train', 'y_train', 'x_test', 'y_test']:
+                self.arrays[name] = np.load(os.path.join(self.folder, f'{name}.npy'), mmap_mode='r')
+        return self.arrays
+
+    def partition(self, index):
+        # only the node's own training samples are copied and normalised
+        arrays = self.load()
+        x_train = normalize_images(self.dataset, arrays['x_train'][index])
+        y_train = one_hot_labels(self.dataset, arrays['y_train'][index])
+        return x_train, y_train, arrays['x_test'], arrays['y_test']
+
+    def remove(self):
+        self.arrays = None
+        shutil.rmtree(self.folder, ignore_errors=True)
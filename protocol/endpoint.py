@@ -0,0 +1,84 @@
+import queue
+import threading
+import traceback
+from timeit import default_timer as timer
+
+from helpers.timing import PhaseTimer, timed
+
+
+class Endpoint:
+    """
+    A participant that receives messages through a transport and handles them one at a time
+    on its own worker thread, so transports never block on training or aggregation work.
+    Messages are sent in order from a sender thread, so handling overlaps with sending.
+
+    The endpoint's timer adds up the time spent sending, encoding and decoding messages, and the
+    time received messages wait before they are handled, next to the phases its subclass times.
+    """
+
+    def __init__(self, port, transport):
+        self.port = port
+        self.transport = transport
+        self.inbox = queue.Queue()
+        self.outbox = queue.Queue()
+        self.worker = None
+        self.sender = None
+        self.timer = PhaseTimer()
+        self.transport.register(self)
+
+    def start(self):
+        self.worker = threading.Thread(target=self.process, daemon=True)
+        self.worker.start()
+        self.sender = threading.Thread(target=self.flush, daemon=True)
+        self.sender.start()
+        self.transport.serve(self)
+
+    def stop(self):
+        # the transport is closed once the messages sent before stopping are out
+        self.inbox.put(None)
+        self.outbox.put(None)
+
+    def deliver(self, data):
+        self.inbox.put((timer(), data))
+
+    def send(self, port, data):
+        self.outbox.put((port, data))
+
+    def flush(self):
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                break
+
+            port, data = message
+            try:
+                with self.timer.span('send'):
+                    self.transport.send(port, data, sender=self.port)
+            except Exception:
+                traceback.print_exc()
+
+        self.transport.close(self)
+
+    def process(self):
+        while True:
+            message = self.inbox.get()
+            if message is None:
+                break
+
+            received, data = message
+            self.timer.add('queued', timer() - received)
+            try:
+                self.handle(data)
+            except Exception:
+                traceback.print_exc()
+
+    @timed('encoding')
+    def pack(self, value):
+        return self.transport.pack(value)
+
+    @timed('decoding')
+    def unpack(self, value):
+        return self.transport.unpack(value)
+
+    def handle(self, data):
+        raise NotImplementedError
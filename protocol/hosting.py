@@ -0,0 +1,97 @@
+import os
+import threading
+import multiprocessing
+import numpy as np
+import tensorflow as tf
+
+from helpers.constants import CLIENT_PORT, READY_TIMEOUT
+from helpers.utils import fetch_index
+from protocol.node import ProtocolNode
+from protocol.pipeline import build_pipeline
+
+
+def create_nodes(pipeline, dataset, ports, indexes, shared_dataset):
+    nodes = []
+    for port in ports:
+        X_train, Y_train, X_test, Y_test = shared_dataset.partition(indexes[port - CLIENT_PORT - 1])
+
+        node = ProtocolNode(
+            port=port,
+            pipeline=pipeline,
+            dataset=dataset,
+            x_train=X_train,
+            y_train=Y_train,
+            x_test=X_test,
+            y_test=Y_test
+        )
+        nodes.append(node)
+    return nodes
+
+
+def start_endpoints(endpoints):
+    threads = []
+    for endpoint in endpoints:
+        t = threading.Thread(target=endpoint.start)
+        t.start()
+        threads.append(t)
+    return threads
+
+
+def host_nodes(options, shared_dataset, ports, peers, intra_op_threads, inter_op_threads, ready):
+    # runs in a worker process, TF threading can only be set before the runtime is initialised
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    pipeline = build_pipeline(**options)
+    pipeline.transport.add_peers(peers)
+    dataset = shared_dataset.dataset
+    indexes = fetch_index(dataset)
+
+    nodes = create_nodes(pipeline, dataset, ports, indexes, shared_dataset)
+    threads = start_endpoints(nodes)
+    ready.put(pipeline.transport.peer_table(ports))
+
+    for t in threads:
+        t.join()
+
+
+def start_workers(options, shared_dataset, ports, peers, workers, intra_op_threads=0, inter_op_threads=1):
+    """
+    Shards the nodes over worker processes, each with its own interpreter and TF runtime,
+    and returns once every worker is serving its nodes.
+
+    :param options: keyword arguments of build_pipeline, the pipeline is rebuilt in every worker
+    :param shared_dataset: SharedDataset the workers memory-map their partitions from
+    :param ports: ports of all nodes
+    :param peers: peer table the nodes reach the server through
+    :param workers: number of worker processes
+    :param intra_op_threads: TF intra-op threads per worker, 0 splits the cores evenly between workers
+    :param inter_op_threads: TF inter-op threads per worker
+    :return: worker processes and the peer table of their nodes
+    """
+
+    if not intra_op_threads:
+        intra_op_threads = max(1, os.cpu_count() // workers)
+
+    # fork is unsafe once TF is imported
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+
+    processes = []
+    for shard in np.array_split(ports, workers):
+        if len(shard) == 0:
+            continue
+
+        process = context.Process(
+            target=host_nodes,
+            args=(options, shared_dataset, [int(port) for port in shard], peers, intra_op_threads, inter_op_threads,
+                  ready)
+        )
+        process.start()
+        processes.append(process)
+
+    node_peers = dict()
+    for _ in processes:
+        node_peers.update(ready.get(timeout=READY_TIMEOUT))
+
+    return processes, node_peers
@@ -0,0 +1,379 @@
+import os
+import json
+import random
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from timeit import default_timer as timer
+
+from helpers import constants
+from helpers.utils import TimingCallback
+from helpers.timing import timed
+from helpers.topology import ShareAllReduce
+from protocol.endpoint import Endpoint
+
+
+class ProtocolNode(Endpoint):
+    """
+    A federated client whose training, sharing, exchanging and reassembly are driven by the pipeline stages.
+
+    With a ring sharer the node masks its model instead of splitting it, and the cohort sums the masked
+    models round a ring. Only the first node of the ring sends the sum to the server.
+
+    Every round's record has the time the node spent in each phase, from training to sending its update.
+    """
+
+    def __init__(self, port, pipeline, dataset, x_train, y_train, x_test, y_test):
+        super().__init__(port, pipeline.transport)
+        self.pipeline = pipeline
+        self.dataset = dataset
+
+        self.cipher = pipeline.make_cipher(port - constants.CLIENT_PORT)
+        self.update_cipher = pipeline.make_update_cipher(port - constants.CLIENT_PORT)
+
+        self.model = None
+        self.epochs = constants.EPOCHS
+
+        self.indexes = dict()
+        self.own_shares = dict()
+        self.other_shares = dict()
+
+        self.fl_nodes = list()
+        self.share_counts = dict()
+        self.assembled = dict()
+        self.attempt = 0
+        self.version = 0
+        self.early_shares = list()
+        self.seeds = dict()
+        self.reducer = None
+        self.ring_sum = None
+
+        self.secret_sharing_time = 0.0
+
+        self.record = list()
+
+        self.round = 0
+        self.current_metrics = dict()
+        self.current_training_time = 0
+
+        self.X_train, self.y_train, self.X_test, self.y_test = x_train, y_train, x_test, y_test
+
+    def handle(self, data):
+        print(f"PORT {self.port} RECEIVED: {data['message']} from {data['port']}")
+
+        if data["message"] == constants.MESSAGE_START_TRAINING:
+            self.start_training(data)
+
+        elif data["message"] == constants.MESSAGE_START_SECRET_SHARING:
+            self.start_secret_sharing(data)
+
+        elif data["message"] in (constants.MESSAGE_MODEL_SHARE, constants.MESSAGE_MASK_SEED,
+                                 constants.MESSAGE_REDUCE_SHARE):
+            self.receive_shares(data)
+
+        elif data["message"] == constants.MESSAGE_START_ASSEMBLY:
+            if data["attempt"] == self.attempt:
+                self.reassemble_shares()
+
+        elif data["message"] == constants.MESSAGE_END_SESSION:
+            self.end_session(data)
+
+    def start_training(self, data):
+        self.transport.add_peers(data["peers"])
+        self.attempt = data["attempt"]
+        self.version = data.get("version", 0)
+        self.indexes = json.loads(data["indexes"]) or dict()
+        # the server's round, a sampled node sits some rounds out
+        self.round = data["round"]
+        self.model = tf.keras.models.model_from_json(data["model_architecture"])
+        self.pipeline.model.compile(self.model)
+        self.model.set_weights(self.unpack(data["model_weights"]))
+
+        cb = TimingCallback()
+
+        with self.timer.span('training'):
+            self.model.fit(self.X_train, self.y_train, epochs=self.epochs, batch_size=10, callbacks=[cb], verbose=False)
+        with self.timer.span('evaluation'):
+            self.current_metrics = self.pipeline.model.evaluate(self.model, self.X_test, self.y_test)
+        self.current_training_time = sum(cb.logs)
+
+        if self.pipeline.sharer is None:
+            self.send_updates()
+            return
+
+        self.secret_sharing_time = 0.0
+
+        data = {
+            "port": self.port,
+            "message": constants.MESSAGE_TRAINING_COMPLETED,
+            "attempt": self.attempt,
+        }
+        self.send(constants.SERVER_PORT, data)
+
+    def reset_shares(self):
+        self.share_counts = dict()
+        self.assembled = dict()
+        for layer in self.model.layers:
+            if layer.trainable_weights:
+                self.own_shares[layer.name] = [None for _ in layer.get_weights()]
+                self.other_shares[layer.name] = list()
+                self.share_counts[layer.name] = 0
+
+    def start_secret_sharing(self, data):
+        # the server starts a new attempt with fewer nodes when a node drops out
+        self.attempt = data["attempt"]
+        self.fl_nodes = [port for port in data["nodes"] if port != self.port]
+        self.reset_shares()
+
+        if self.pipeline.sharer.ring:
+            self.start_ring(data["nodes"])
+            self.replay_early_shares()
+            return
+
+        start_time = timer()
+        shares = int(len(self.fl_nodes) + 1)
+
+        for layer in self.model.layers:
+            if layer.trainable_weights:
+                with self.timer.span('selection'):
+                    selected = self.pipeline.selector.extract(layer.get_weights(), self.indexes.get(layer.name))
+
+                # keep the last share of every weight, the rest go to the other nodes
+                with self.timer.span('sharing'):
+                    layer_shares = [self.pipeline.sharer.split(value, shares) for value in selected]
+                    for i, value_shares in enumerate(layer_shares):
+                        self.accumulate(layer.name, i, value_shares.pop())
+                self.other_shares[layer.name] = layer_shares
+
+                # pipelined runs send every layer while the next one is being shared
+                if self.pipeline.pipelined:
+                    self.exchange_shares([layer.name])
+
+        if not self.pipeline.pipelined:
+            self.exchange_shares(list(self.other_shares.keys()))
+
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - start_time)
+
+        data = {
+            "port": self.port,
+            "message": constants.MESSAGE_SHARES_SENT,
+            "attempt": self.attempt,
+        }
+        self.send(constants.SERVER_PORT, data)
+
+        for layer in self.other_shares.keys():
+            self.count_share(layer)
+
+        self.replay_early_shares()
+
+    def replay_early_shares(self):
+        # shares of peers that started this attempt first
+        early_shares, self.early_shares = self.early_shares, list()
+        for data in early_shares:
+            self.receive_shares(data)
+
+    def start_ring(self, nodes):
+        ring = sorted(nodes)
+        self.ring_sum = None
+        self.reducer = ShareAllReduce(self.port, ring, constants.RING, self.send_ring_share, self.ring_complete,
+                                      encode=self.pack, decode=self.unpack)
+
+        # the lower port of every pair picks the seed of the pair's mask
+        self.seeds = dict()
+        for peer in self.fl_nodes:
+            if peer > self.port:
+                self.seeds[peer] = random.getrandbits(64)
+                with self.timer.span('encryption'):
+                    seed = self.cipher.seal(self.seeds[peer], peer)
+                data = {
+                    "port": self.port,
+                    "message": constants.MESSAGE_MASK_SEED,
+                    "attempt": self.attempt,
+                    "seed": self.pack(seed),
+                }
+                self.send(peer, data)
+
+        self.check_seeds()
+
+    def accept_seed(self, port, seed):
+        seed = self.unpack(seed)
+        with self.timer.span('encryption'):
+            self.seeds[port] = self.cipher.open(seed)
+        self.check_seeds()
+
+    def check_seeds(self):
+        if len(self.seeds) < len(self.fl_nodes):
+            return
+
+        start_time = timer()
+        streams = self.pipeline.sharer.streams(self.seeds)
+        layer_weights = dict()
+        for layer in self.model.layers:
+            if layer.trainable_weights:
+                # the masks only cancel exactly in float64, the layer stays float64 until the ring sum is done
+                weights = [weight.astype(np.float64) for weight in layer.get_weights()]
+                indexes = self.indexes.get(layer.name)
+                with self.timer.span('selection'):
+                    selected = self.pipeline.selector.extract(weights, indexes)
+                with self.timer.span('sharing'):
+                    masked = [self.pipeline.sharer.mask(value, streams, self.port) for value in selected]
+                layer_weights[layer.name] = self.pipeline.selector.replace(weights, indexes, masked)
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - start_time)
+
+        self.reducer.reduce(layer_weights)
+        self.finish_ring()
+
+    def send_ring_share(self, data, port):
+        self.send(port, dict(data, attempt=self.attempt))
+
+    def ring_complete(self, layer_weights):
+        # runs inside the aggregation span, the round is recorded once the span has been closed
+        self.ring_sum = layer_weights
+
+    def finish_ring(self):
+        if self.ring_sum is None:
+            return
+
+        layer_weights, self.ring_sum = self.ring_sum, None
+        self.record_round(secret_sharing=self.secret_sharing_time)
+
+        if self.port == self.reducer.servers[0]:
+            self.send_weights(layer_weights, count=len(self.reducer.servers))
+
+    def exchange_shares(self, layers):
+        for client in self.fl_nodes:
+            layer_weights = dict()
+
+            for layer in layers:
+                layer_weights[layer] = [value_shares.pop() for value_shares in self.other_shares[layer]]
+
+            with self.timer.span('encryption'):
+                model_share = self.cipher.seal(layer_weights, client)
+            data = {
+                "port": self.port,
+                "message": constants.MESSAGE_MODEL_SHARE,
+                "attempt": self.attempt,
+                "model_share": self.pack(model_share),
+            }
+            self.send(client, data)
+
+    def receive_shares(self, data):
+        if data["attempt"] > self.attempt:
+            self.early_shares.append(data)
+        elif data["attempt"] != self.attempt:
+            return
+        elif data["message"] == constants.MESSAGE_MASK_SEED:
+            self.accept_seed(data["port"], data["seed"])
+        elif data["message"] == constants.MESSAGE_REDUCE_SHARE:
+            start_time = timer()
+            with self.timer.span('aggregation'):
+                self.reducer.receive(data)
+            self.secret_sharing_time = self.secret_sharing_time + (timer() - start_time)
+            self.finish_ring()
+        else:
+            self.accept_shares(data["model_share"])
+
+    def accept_shares(self, model_share):
+        start_time = timer()
+
+        model_share = self.unpack(model_share)
+        with self.timer.span('encryption'):
+            layer_weights = self.cipher.open(model_share)
+        with self.timer.span('aggregation'):
+            for layer, weights in layer_weights.items():
+                for i, value in enumerate(weights):
+                    self.accumulate(layer, i, value)
+
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - start_time)
+        for layer in layer_weights.keys():
+            self.count_share(layer)
+
+    def accumulate(self, layer, i, share):
+        self.own_shares[layer][i] = self.pipeline.sharer.accumulate(self.own_shares[layer][i], share)
+
+    def count_share(self, layer):
+        # a layer is reassembled as soon as every node's share of it has arrived
+        self.share_counts[layer] += 1
+        if self.share_counts[layer] == int(len(self.fl_nodes) + 1):
+            self.assemble_layer(layer)
+            self.check_sharing_complete()
+
+    @timed('aggregation')
+    def assemble_layer(self, layer):
+        start_time = timer()
+        self.assembled[layer] = self.pipeline.selector.replace(
+            self.model.get_layer(layer).get_weights(),
+            self.indexes.get(layer),
+            self.own_shares[layer]
+        )
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - start_time)
+
+    def check_sharing_complete(self):
+        if len(self.assembled) == len(self.own_shares):
+            data = {
+                "port": self.port,
+                "message": constants.MESSAGE_SHARING_COMPLETE,
+                "attempt": self.attempt,
+            }
+            self.send(constants.SERVER_PORT, data)
+
+    def reassemble_shares(self):
+        # every layer was reassembled as its last share arrived
+        self.record_round(secret_sharing=self.secret_sharing_time)
+        self.send_weights(self.assembled)
+
+    def send_updates(self):
+        layer_weights = dict()
+        for layer in self.model.layers:
+            if layer.trainable_weights:
+                layer_weights[layer.name] = layer.get_weights()
+
+        self.record_round()
+        self.send_weights(layer_weights)
+
+    def record_round(self, **extra):
+        # a repeated attempt replaces the round's record, the phase times of both attempts add up
+        times = self.timer.collect()
+        if self.record and self.record[-1]['round'] == self.round:
+            earlier = self.record.pop()
+            phases = sorted(set(times) | set(key for key in earlier if key.endswith('_time')))
+            times = {phase: times.get(phase, 0.0) + earlier.get(phase, 0.0) for phase in phases}
+
+        self.record.append({
+            'round': self.round,
+            **self.current_metrics,
+            'training': self.current_training_time,
+            **extra,
+            **times,
+        })
+
+    def send_weights(self, layer_weights, count=1):
+        with self.timer.span('encryption'):
+            model_weights = self.update_cipher.seal(layer_weights, constants.SERVER_PORT)
+        data = {
+            "port": self.port,
+            "message": constants.MESSAGE_FL_UPDATE,
+            "attempt": self.attempt,
+            "version": self.version,
+            "count": count,
+            "model_weights": self.pack(model_weights),
+        }
+        self.send(constants.SERVER_PORT, data)
+
+    def end_session(self, data):
+        self.model.set_weights(self.unpack(data["model_weights"]))
+        self.disconnect()
+
+    def disconnect(self):
+        output_folder = self.pipeline.results_folder(self.dataset)
+        os.makedirs(output_folder, exist_ok=True)
+        csv_filename = f'client_{self.port - constants.CLIENT_PORT}.csv'
+        csv_path = os.path.join(output_folder, csv_filename)
+        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
+
+        data = {
+            "port": self.port,
+            "message": constants.MESSAGE_NODE_DISCONNECTED,
+        }
+        self.send(constants.SERVER_PORT, data)
+        self.stop()
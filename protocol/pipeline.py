@@ -0,0 +1,87 @@
+import os
+
+from protocol.transport import HttpTransport, UnixSocketTransport, WebSocketTransport, InMemoryTransport
+from protocol.stages import FullSelector, IndexSelector, AdditiveSharer, RingSharer
+from protocol.stages import PlainCipher, RSACipher, EllipticCipher
+from protocol.stages import FedAvgAggregator, FedAsyncAggregator, ClassificationModel, RegressionModel
+from protocol.stages import AllSampler, UniformSampler, StratifiedSampler, ThroughputSampler
+
+SHARERS = {'none': None, 'additive': AdditiveSharer, 'ring': RingSharer}
+CIPHERS = {'plain': PlainCipher, 'rsa': RSACipher, 'elliptical': EllipticCipher}
+TRANSPORTS = {'http': HttpTransport, 'uds': UnixSocketTransport, 'ws': WebSocketTransport,
+              'memory': InMemoryTransport}
+AGGREGATORS = {'fedavg': FedAvgAggregator, 'fedasync': FedAsyncAggregator}
+MODELS = {'lenet5': ClassificationModel, 'regression': RegressionModel}
+SAMPLERS = {'all': AllSampler, 'uniform': UniformSampler, 'stratified': StratifiedSampler,
+            'throughput': ThroughputSampler}
+
+
+class Pipeline:
+    """
+    The stages a run is configured with. A sharer of None runs plain FedAvg, pipelined runs
+    exchange and reassemble shares layer by layer. The sampler picks the nodes of every round.
+    """
+
+    def __init__(self, selector, sharer, cipher, transport, aggregator, model, group_size=0, pipelined=False,
+                 sampler=None):
+        self.selector = selector
+        self.sharer = sharer
+        self.cipher = cipher
+        self.transport = transport
+        self.aggregator = aggregator
+        self.model = model
+        self.group_size = group_size
+        self.pipelined = pipelined
+        self.sampler = sampler or AllSampler()
+
+    @property
+    def name(self):
+        sharer = 'none' if self.sharer is None else self.sharer.name
+        stages = [sharer, self.selector.name, self.cipher.name, self.transport.name, self.aggregator.name]
+        if self.group_size:
+            stages.append(str(self.group_size))
+        if self.pipelined:
+            stages.append('pipelined')
+        if self.sampler.size:
+            stages.append(f'{self.sampler.name}{self.sampler.size}')
+        return '_'.join(stages)
+
+    def make_cipher(self, key_id):
+        return self.cipher(key_id)
+
+    def make_update_cipher(self, key_id):
+        # reassembled updates are already masked, only plain FedAvg encrypts what it sends to the server
+        if self.sharer is None:
+            return self.cipher(key_id)
+        return PlainCipher(key_id)
+
+    def results_folder(self, dataset):
+        current_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        return current_dir + f"/resources/results/{self.experiment}/{dataset}"
+
+    @property
+    def experiment(self):
+        return f"engine_{self.name}"
+
+
+def build_selector(name):
+    if name == FullSelector.name:
+        return FullSelector()
+    return IndexSelector(name)
+
+
+def build_pipeline(selector='full', sharer='additive', cipher='plain', transport='http', aggregator='fedavg',
+                   model='lenet5', group_size=0, pipelined=False, sampler='all', sample_size=0):
+    sharer = SHARERS[sharer]
+
+    return Pipeline(
+        selector=build_selector(selector),
+        sharer=None if sharer is None else sharer(),
+        cipher=CIPHERS[cipher],
+        transport=TRANSPORTS[transport](),
+        aggregator=AGGREGATORS[aggregator](),
+        model=MODELS[model],
+        group_size=group_size,
+        pipelined=pipelined,
+        sampler=SAMPLERS[sampler](sample_size)
+    )
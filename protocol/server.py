@@ -0,0 +1,373 @@
+import os
+import json
+import math
+import pandas as pd
+from timeit import default_timer as timer
+
+from helpers import constants
+from helpers.utils import generate_groups
+from helpers.barrier import RoundBarrier
+from helpers.checkpoint import RoundCheckpoint, resume_record
+from helpers.metrics import MetricsWriter, read_metrics
+from protocol.endpoint import Endpoint
+
+
+class ProtocolServer(Endpoint):
+    """
+    Coordinates the rounds of a pipeline run and aggregates the nodes' updates.
+
+    With a deadline or quorum a round goes on without the slowest nodes: sharing starts with the
+    cohort that finished training, and if a cohort node drops out after that its peers share again
+    among the nodes still responding, so the aggregate is always the sum over one complete cohort.
+    Every phase attempt has its own number, messages of an earlier attempt are ignored.
+
+    Only the participants the pipeline's sampler picks for a round train, share and are aggregated.
+
+    An asynchronous aggregator has no rounds to wait for: every update is merged as it arrives and
+    its node gets the new global model straight away. Every len(nodes) merged updates are evaluated
+    as one round.
+
+    Every round's record has the time the server spent in each phase, e.g. selection or aggregation.
+
+    The global model, the round and the indexes selected for it are checkpointed as every round
+    starts, a run that is started again resumes from there with the same selection.
+    """
+
+    def __init__(self, port, pipeline, dataset, x_test, y_test, deadline=None, quorum=None):
+        super().__init__(port, pipeline.transport)
+        self.pipeline = pipeline
+        self.dataset = dataset
+
+        self.cipher = pipeline.make_update_cipher('server')
+
+        self.nodes = list()
+        self.participants = list()
+        self.node_times = dict()
+        self.groupings = list()
+
+        self.start_time = None
+        self.end_time = None
+        self.X_test, self.y_test = x_test, y_test
+
+        self.global_model = pipeline.model.build(dataset)
+        self.max_rounds = constants.ROUNDS
+        self.round = 0
+        self.attempt = 0
+        self.version = 0
+        self.staleness = list()
+        self.cohort = list()
+        self.deadline = deadline
+        self.quorum = quorum
+        self.barrier = RoundBarrier(timeout=deadline or constants.PHASE_TIMEOUT, on_timeout=self.phase_timed_out)
+        self.disconnected_count = 0
+
+        self.record = list()
+        self.resumed_indexes = None
+
+        output_folder = pipeline.results_folder(dataset)
+        self.checkpoint = RoundCheckpoint(os.path.join(output_folder, 'server.npz'))
+        self.metrics = MetricsWriter(os.path.join(output_folder, 'server.jsonl'))
+        self.check_current_round()
+
+    def check_current_round(self):
+        checkpoint = self.checkpoint.load()
+        if checkpoint is not None and checkpoint['round'] < self.max_rounds:
+            self.round = checkpoint['round']
+            self.record = resume_record(checkpoint, read_metrics(self.metrics.path))
+            self.metrics.rewrite(self.record)
+            self.global_model.set_weights(checkpoint['weights'])
+            self.resumed_indexes = checkpoint['indexes']
+            print(f"Resuming after round ({self.round})")
+        else:
+            self.metrics.clear()
+
+    def save_checkpoint(self, indexes=None):
+        row = self.record[-1] if self.record else None
+        self.checkpoint.save(self.round, self.global_model.get_weights(), indexes, row)
+
+    def handle(self, data):
+        print(f"SERVER RECEIVED: {data['message']} from PORT: {data['port']}")
+
+        if data.get("attempt", self.attempt) != self.attempt:
+            print(f"Ignoring {data['message']} of attempt {data['attempt']} from PORT: {data['port']}")
+            return
+
+        if data["message"] == constants.MESSAGE_FL_UPDATE:
+            self.fl_update(data["port"], data["model_weights"], data.get("version", 0), data.get("count", 1))
+
+        elif data["message"] == constants.MESSAGE_TRAINING_COMPLETED:
+            self.training_completed(data["port"])
+
+        elif data["message"] == constants.MESSAGE_SHARES_SENT:
+            self.barrier.arrive('shared', data["port"])
+
+        elif data["message"] == constants.MESSAGE_SHARING_COMPLETE:
+            self.start_assembly(data["port"])
+
+        elif data["message"] == constants.MESSAGE_PHASE_DEADLINE:
+            self.phase_deadline(data["phase"])
+
+        elif data["message"] == constants.MESSAGE_NODE_DISCONNECTED:
+            self.node_disconnected()
+
+    def send_to_nodes(self, data):
+        for port in self.nodes:
+            self.send(port, data)
+
+    def peers_of(self, port, cohort=None):
+        if not self.groupings:
+            peers = self.participants
+        else:
+            # a node shares with every node it is grouped with
+            peers = sorted(set(peer for group in self.groupings if port in group for peer in group))
+
+        if cohort is None:
+            return peers
+        return [peer for peer in peers if peer in cohort]
+
+    def quorum_of(self, nodes):
+        if not self.quorum:
+            return None
+        return max(1, math.ceil(self.quorum * len(nodes)))
+
+    def start_round(self, nodes=None):
+        if nodes:
+            self.nodes = nodes
+
+        print(f'Starting round ({self.round + 1})')
+
+        if self.pipeline.aggregator.asynchronous:
+            self.start_asynchronous()
+            return
+
+        self.start_time = timer()
+        self.attempt += 1
+        self.participants = self.pipeline.sampler.sample(self.nodes, self.node_times)
+        self.cohort = list(self.participants)
+        if len(self.participants) < len(self.nodes):
+            print(f"Sampled {len(self.participants)} of {len(self.nodes)} nodes")
+
+        self.barrier.reset()
+        quorum = self.quorum_of(self.participants)
+        if self.pipeline.sharer is not None:
+            self.barrier.open('training', self.participants, quorum=quorum, tag=self.attempt)
+        else:
+            self.barrier.open('update', self.participants, quorum=quorum, tag=self.attempt)
+        self.pipeline.aggregator.reset(self.global_model)
+
+        if self.pipeline.group_size:
+            self.groupings = generate_groups(list(self.participants), self.pipeline.group_size)
+
+        indexes, self.resumed_indexes = self.resumed_indexes, None
+        if indexes is None:
+            with self.timer.span('selection'):
+                indexes = self.pipeline.selector.select(self.global_model, self.X_test, self.y_test)
+        self.save_checkpoint(indexes)
+
+        data = {
+            "port": "SERVER",
+            "message": constants.MESSAGE_START_TRAINING,
+            "attempt": self.attempt,
+            "round": self.round + 1,
+            "indexes": json.dumps(indexes),
+            "model_architecture": self.global_model.to_json(),
+            "model_weights": self.pack(self.global_model.get_weights()),
+        }
+        for port in self.participants:
+            self.send(port, dict(data, peers=self.transport.peer_table(list(self.peers_of(port)) + [self.port])))
+
+    def start_asynchronous(self):
+        # every node trains continuously on the latest model
+        self.start_time = timer()
+        self.participants = list(self.nodes)
+        for port in self.participants:
+            self.send_model(port)
+
+    def send_model(self, port):
+        data = {
+            "port": "SERVER",
+            "message": constants.MESSAGE_START_TRAINING,
+            "attempt": self.attempt,
+            "version": self.version,
+            "round": self.round + 1,
+            "indexes": json.dumps(None),
+            "model_architecture": self.global_model.to_json(),
+            "model_weights": self.pack(self.global_model.get_weights()),
+            "peers": self.transport.peer_table([self.port]),
+        }
+        self.send(port, data)
+
+    def training_completed(self, port):
+        self.node_times[port] = timer() - self.start_time
+        if self.barrier.arrive('training', port):
+            self.start_secret_sharing(self.barrier.cohort('training'))
+
+    def start_secret_sharing(self, cohort):
+        # a new attempt, shares and updates of an earlier one no longer add up
+        self.attempt += 1
+        self.cohort = sorted(cohort)
+        self.pipeline.aggregator.reset(self.global_model)
+
+        if len(self.cohort) < len(self.participants):
+            print(f"Sharing among {len(self.cohort)} of {len(self.participants)} nodes")
+
+        if self.pipeline.sharer.ring:
+            # the cohort sums its models round a ring, the first node sends the sum
+            self.barrier.open('update', self.cohort[:1], tag=self.attempt)
+        else:
+            self.barrier.open('shared', self.cohort, tag=self.attempt)
+            self.barrier.open('sharing', self.cohort, tag=self.attempt)
+            self.barrier.open('update', self.cohort, tag=self.attempt)
+
+        data = {
+            "port": "SERVER",
+            "message": constants.MESSAGE_START_SECRET_SHARING,
+            "attempt": self.attempt,
+        }
+        for port in self.cohort:
+            self.send(port, dict(data, nodes=self.peers_of(port, self.cohort)))
+
+    def start_assembly(self, port):
+        self.barrier.arrive('sharing', port)
+        data = {
+            "port": "SERVER",
+            "message": constants.MESSAGE_START_ASSEMBLY,
+            "attempt": self.attempt,
+        }
+        self.send(port, data)
+
+    def fl_update(self, node, model_weights, version=0, count=1):
+        if self.pipeline.aggregator.asynchronous:
+            self.merge_update(node, model_weights, version)
+            return
+
+        if not self.barrier.expects('update', node):
+            return
+
+        if self.pipeline.sharer is None:
+            self.node_times[node] = timer() - self.start_time
+
+        model_weights = self.unpack(model_weights)
+        with self.timer.span('encryption'):
+            layer_weights = self.cipher.open(model_weights)
+        with self.timer.span('aggregation'):
+            self.pipeline.aggregator.add(layer_weights, count)
+
+        if self.barrier.arrive('update', node):
+            self.apply_updates()
+
+    def merge_update(self, node, model_weights, version):
+        if self.round >= self.max_rounds:
+            return
+
+        # updates trained on an older version of the global model count less
+        staleness = self.version - version
+        model_weights = self.unpack(model_weights)
+        with self.timer.span('encryption'):
+            layer_weights = self.cipher.open(model_weights)
+        with self.timer.span('aggregation'):
+            self.pipeline.aggregator.merge(self.global_model, layer_weights, staleness)
+        self.version += 1
+        self.staleness.append(staleness)
+
+        if self.version % len(self.nodes) == 0:
+            self.evaluate(staleness=sum(self.staleness) / len(self.staleness))
+            self.staleness = list()
+            self.start_time = timer()
+            self.round += 1
+            if self.round >= self.max_rounds:
+                self.end_session()
+                return
+            self.save_checkpoint()
+
+        self.send_model(node)
+
+    def phase_timed_out(self, phase, missing, attempt):
+        # runs on the barrier's timer thread, the deadline is handled in order with the other messages
+        self.barrier.report_timeout(phase, missing, attempt)
+        if self.deadline:
+            self.deliver({
+                "port": self.port,
+                "message": constants.MESSAGE_PHASE_DEADLINE,
+                "phase": phase,
+                "attempt": attempt,
+            })
+
+    def phase_deadline(self, phase):
+        if phase == 'training':
+            cohort = self.barrier.complete('training')
+            if cohort:
+                self.start_secret_sharing(cohort)
+
+        elif phase == 'update' and self.pipeline.sharer is None:
+            if self.barrier.complete('update'):
+                self.apply_updates()
+
+        elif phase == 'update':
+            # nodes that sent no shares, or no update once every share was out, are left out of a new attempt
+            if self.barrier.missing('shared'):
+                cohort = self.barrier.arrived('shared')
+            else:
+                cohort = self.barrier.arrived('update')
+
+            if cohort:
+                self.start_secret_sharing(cohort)
+
+    def apply_updates(self):
+        with self.timer.span('aggregation'):
+            self.pipeline.aggregator.apply(self.global_model)
+        self.evaluate()
+        self.end_round()
+
+    def evaluate(self, **extra):
+        with self.timer.span('evaluation'):
+            self.pipeline.model.compile(self.global_model)
+            metrics = self.pipeline.model.evaluate(self.global_model, self.X_test, self.y_test)
+        self.end_time = timer() - self.start_time
+        print('Metrics: ', metrics)
+        print(f'Round ({self.round + 1}) Time: {self.end_time}')
+
+        self.record.append({
+            'round': self.round + 1,
+            **metrics,
+            'fl': self.end_time,
+            **self.barrier.latencies(),
+            **self.timer.collect(),
+            **extra,
+        })
+        self.metrics.write(self.record[-1])
+
+    def end_round(self):
+        print("ROUND ENDED")
+        self.round += 1
+        if self.round < self.max_rounds:
+            self.start_round()
+        else:
+            self.end_session()
+
+    def end_session(self):
+        print("SESSION ENDED")
+        self.barrier.reset()
+        data = {
+            "port": "SERVER",
+            "message": constants.MESSAGE_END_SESSION,
+            "model_weights": self.pack(self.global_model.get_weights()),
+        }
+
+        output_folder = self.pipeline.results_folder(self.dataset)
+        os.makedirs(output_folder, exist_ok=True)
+        csv_filename = 'server.csv'
+        csv_path = os.path.join(output_folder, csv_filename)
+        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
+        self.save_checkpoint()
+        self.checkpoint.flush()
+        self.metrics.flush()
+
+        self.send_to_nodes(data)
+
+    def node_disconnected(self):
+        # combine the client results once every node has written them
+        self.disconnected_count += 1
+        if self.disconnected_count == len(self.nodes):
+            self.pipeline.model.summarize(self.pipeline.experiment, self.dataset)
+            self.stop()
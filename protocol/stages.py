@@ -0,0 +1,374 @@
+import pickle
+import random
+import numpy as np
+import tensorflow as tf
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from helpers import constants
+from helpers.utils import encode_layer, decode_layer, generate_additive_shares, get_public_key, get_private_key
+from helpers.utils import random_weight_selection, magnitude_weight_selection, obd_weight_selection
+from helpers.utils import regularization_weight_selection, encrypt_message_elliptical, decrypt_message_elliptical
+from helpers.utils import get_lenet5_classification, get_regression_model, combine_find_mean
+from helpers.utils import combine_find_mean_regression, accumulate_share
+
+
+def peer_key_id(port):
+    # keys are stored per client number, the server has its own key pair
+    if port == constants.SERVER_PORT:
+        return 'server'
+    return port - constants.CLIENT_PORT
+
+
+class FullSelector:
+    """
+    Selects every trainable weight of a layer for sharing (AddShare).
+    """
+
+    name = 'full'
+
+    def select(self, model, x, y):
+        return None
+
+    def extract(self, weights, indexes):
+        return weights
+
+    def replace(self, weights, indexes, values):
+        return list(values)
+
+
+class IndexSelector:
+    """
+    Selects a fraction of each layer's weights on the server every round (AddShare+).
+    """
+
+    def __init__(self, pruning_type, threshold=constants.THRESHOLD):
+        self.name = pruning_type
+        self.pruning_type = pruning_type
+        self.threshold = threshold
+
+    def select(self, model, x, y):
+        indexes = dict()
+        for layer in model.layers:
+            if layer.trainable_weights:
+                indexes[layer.name] = [
+                    self.select_weights(model, x, y, layer, 0),
+                    self.select_weights(model, x, y, layer, 1),
+                ]
+        return indexes
+
+    def select_weights(self, model, x, y, layer, position):
+        if self.pruning_type == constants.RANDOM:
+            return random_weight_selection(layer.get_weights()[position], self.threshold)
+        elif self.pruning_type == constants.MAGNITUDE:
+            return magnitude_weight_selection(layer.get_weights()[position], self.threshold)
+        elif self.pruning_type == constants.OBD:
+            return obd_weight_selection(model, x, y, layer.trainable_weights[position], self.threshold)
+        else:
+            return regularization_weight_selection(
+                model,
+                x,
+                y,
+                self.pruning_type,
+                layer.trainable_weights[position],
+                self.threshold
+            )
+
+    def extract(self, weights, indexes):
+        return [weight[self.as_index(index)] for weight, index in zip(weights, indexes)]
+
+    def replace(self, weights, indexes, values):
+        # replace original selected weights with assembled additive shares
+        for weight, index, value in zip(weights, indexes, values):
+            weight[self.as_index(index)] = value
+        return weights
+
+    @staticmethod
+    def as_index(index):
+        return tuple(np.array(li) for li in index)
+
+
+class AllSampler:
+    """
+    Every node takes part in every round.
+    """
+
+    name = 'all'
+
+    def __init__(self, size=0):
+        self.size = size
+
+    def sample(self, nodes, node_times):
+        return list(nodes)
+
+    def covers(self, nodes):
+        return not self.size or self.size >= len(nodes)
+
+
+class UniformSampler(AllSampler):
+    """
+    Samples size nodes uniformly at random every round.
+    """
+
+    name = 'uniform'
+
+    def sample(self, nodes, node_times):
+        if self.covers(nodes):
+            return list(nodes)
+        return sorted(random.sample(list(nodes), self.size))
+
+
+class StratifiedSampler(AllSampler):
+    """
+    Splits the nodes in port order into size strata of equal size and samples one node from each,
+    so every block of data partitions is represented in every round.
+    """
+
+    name = 'stratified'
+
+    def sample(self, nodes, node_times):
+        if self.covers(nodes):
+            return list(nodes)
+        return sorted(int(random.choice(stratum)) for stratum in np.array_split(sorted(nodes), self.size))
+
+
+class ThroughputSampler(AllSampler):
+    """
+    Samples size nodes with a probability proportional to how fast they finished their last training.
+    Nodes that have not trained yet count as the fastest, so every node is tried early on.
+    """
+
+    name = 'throughput'
+
+    def sample(self, nodes, node_times):
+        if self.covers(nodes):
+            return list(nodes)
+
+        nodes = list(nodes)
+        known = [node_times[node] for node in nodes if node in node_times]
+        fastest = min(known) if known else 1.0
+        speeds = np.array([1.0 / max(node_times.get(node, fastest), 1e-6) for node in nodes])
+        chosen = np.random.choice(len(nodes), size=self.size, replace=False, p=speeds / speeds.sum())
+        return sorted(nodes[i] for i in chosen)
+
+
+class AdditiveSharer:
+    name = 'additive'
+    ring = False
+
+    def split(self, value, n):
+        return list(generate_additive_shares(value, n))
+
+    def accumulate(self, total, share):
+        # running sum, None starts a new one
+        return accumulate_share(total, share)
+
+
+class RingSharer(AdditiveSharer):
+    """
+    Masks the selected weights of every node with pairwise masks that cancel in the sum, and sums the
+    masked models with a ring reduce-scatter and all-gather. Each node sends 2 (N - 1) / N of its model
+    instead of a share to every other node. Every pair of nodes draws its mask from a seed the lower
+    port sends the higher one, the lower port adds the mask and the higher port subtracts it.
+    """
+
+    name = 'ring'
+    ring = True
+
+    @staticmethod
+    def streams(seeds):
+        return {peer: np.random.default_rng(seed) for peer, seed in sorted(seeds.items())}
+
+    @staticmethod
+    def mask(value, streams, port):
+        masked = np.array(value, dtype=np.float64)
+        for peer, stream in streams.items():
+            noise = stream.uniform(-1.0, 1.0, size=masked.shape)
+            masked += noise if port < peer else -noise
+        return masked
+
+
+class PlainCipher:
+    name = 'plain'
+
+    def __init__(self, key_id=None):
+        self.key_id = key_id
+
+    def seal(self, payload, recipient):
+        return payload
+
+    def open(self, sealed):
+        return sealed
+
+
+class RSACipher:
+    """
+    Chunked RSA-OAEP encryption of a pickled payload, as used by the *_encrypted experiments.
+    """
+
+    name = 'rsa'
+
+    def __init__(self, key_id):
+        self.key_id = key_id
+        self.private_key = None
+        self.public_keys = dict()
+
+    @staticmethod
+    def padding():
+        return padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+    def public_key(self, recipient):
+        key_id = peer_key_id(recipient)
+        if key_id not in self.public_keys:
+            self.public_keys[key_id] = get_public_key(key_id, self.name)
+        return self.public_keys[key_id]
+
+    def seal(self, payload, recipient):
+        public_key = self.public_key(recipient)
+        value_bytes = pickle.dumps(payload)
+
+        encrypted_messages = []
+        for start in range(0, len(value_bytes), constants.CHUNK_SIZE):
+            chunk = value_bytes[start:start + constants.CHUNK_SIZE]
+            encrypted_messages.append(public_key.encrypt(chunk, self.padding()))
+
+        return encrypted_messages
+
+    def open(self, sealed):
+        if self.private_key is None:
+            self.private_key = get_private_key(self.key_id, self.name)
+
+        decrypted_messages = [self.private_key.decrypt(chunk, self.padding()) for chunk in sealed]
+        return pickle.loads(b''.join(decrypted_messages))
+
+
+class EllipticCipher(RSACipher):
+    """
+    ECDH + AES-GCM encryption of a pickled payload, as used by addshare_plus_elliptical.py.
+    """
+
+    name = 'elliptical'
+
+    def seal(self, payload, recipient):
+        public_key = self.public_key(recipient)
+        ephemeral_public_key, ciphertext = encrypt_message_elliptical(encode_layer(payload), public_key)
+        ephemeral_public_key_pem = ephemeral_public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        return [ephemeral_public_key_pem, ciphertext]
+
+    def open(self, sealed):
+        if self.private_key is None:
+            self.private_key = get_private_key(self.key_id, self.name)
+
+        ephemeral_public_key_pem, ciphertext = sealed
+        ephemeral_public_key = serialization.load_pem_public_key(ephemeral_public_key_pem, backend=default_backend())
+        return decode_layer(decrypt_message_elliptical(ciphertext, ephemeral_public_key, self.private_key))
+
+
+class FedAvgAggregator:
+    """
+    Sums the updates as they arrive and averages over however many were added, so a round can
+    be aggregated from the updates that made its deadline.
+    """
+
+    name = 'fedavg'
+    asynchronous = False
+
+    def __init__(self):
+        self.sum_weights = dict()
+        self.count = 0
+
+    def reset(self, model):
+        self.sum_weights = dict()
+        self.count = 0
+        for layer in model.layers:
+            if layer.trainable_weights:
+                self.sum_weights[layer.name] = None
+
+    def add(self, layer_weights, count=1):
+        # an update summed over several nodes counts once for each of them
+        for layer, weights in layer_weights.items():
+            if self.sum_weights[layer] is None:
+                self.sum_weights[layer] = [None for _ in weights]
+            for i, weight in enumerate(weights):
+                self.sum_weights[layer][i] = accumulate_share(self.sum_weights[layer][i], weight)
+        self.count += count
+
+    def apply(self, model):
+        for layer in model.layers:
+            if layer.trainable_weights:
+                layer.set_weights([weight / self.count for weight in self.sum_weights[layer.name]])
+
+
+class FedAsyncAggregator:
+    """
+    Merges every update into the global model as soon as it arrives (FedAsync). An update trained
+    on a model that is staleness versions old is mixed in with weight mixing * (staleness + 1) ** -exponent.
+    """
+
+    name = 'fedasync'
+    asynchronous = True
+
+    def __init__(self, mixing=0.6, exponent=0.5):
+        self.mixing = mixing
+        self.exponent = exponent
+
+    def reset(self, model):
+        pass
+
+    def merge(self, model, layer_weights, staleness):
+        weight = self.mixing * (staleness + 1) ** -self.exponent
+        for layer, weights in layer_weights.items():
+            current = model.get_layer(layer).get_weights()
+            model.get_layer(layer).set_weights([(1 - weight) * c + weight * w for c, w in zip(current, weights)])
+        return weight
+
+
+class ClassificationModel:
+    name = 'lenet5'
+
+    @staticmethod
+    def build(dataset):
+        return get_lenet5_classification(dataset)
+
+    @staticmethod
+    def compile(model):
+        model.compile(optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=0.001),
+                      loss='categorical_crossentropy', metrics=['accuracy'])
+
+    @staticmethod
+    def evaluate(model, x, y):
+        _, accuracy = model.evaluate(x, y, verbose=0)
+        return {'accuracy': accuracy}
+
+    @staticmethod
+    def summarize(experiment, dataset):
+        combine_find_mean(experiment, dataset)
+
+
+class RegressionModel:
+    name = 'regression'
+
+    @staticmethod
+    def build(dataset):
+        return get_regression_model()
+
+    @staticmethod
+    def compile(model):
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=0.01),
+            loss=tf.keras.losses.mae,
+            metrics=[tf.keras.metrics.RootMeanSquaredError(), tf.keras.metrics.MeanAbsolutePercentageError()]
+        )
+
+    @staticmethod
+    def evaluate(model, x, y):
+        loss, rmse, mape = model.evaluate(x, y, verbose=0)
+        return {'loss': loss, 'rmse': rmse, 'mape': mape}
+
+    @staticmethod
+    def summarize(experiment, dataset):
+        combine_find_mean_regression(experiment, dataset)
@@ -0,0 +1,318 @@
+import io
+import os
+import json
+import httpx
+import socket
+import uvicorn
+import tempfile
+import threading
+import numpy as np
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect, unix_connect
+
+from helpers.constants import ADDRESS, READY_TIMEOUT, FRAME_SIZE
+from helpers.utils import post_with_retries, encode_layer, decode_layer
+
+
+class HttpTransport:
+    """
+    One FastAPI /message endpoint per participant, messages are JSON POSTs. Endpoints bind an
+    ephemeral port on ADDRESS when they register, their port number is only an id which the
+    peer table maps to the URL they are served on.
+    """
+
+    name = 'http'
+
+    def __init__(self, address=ADDRESS):
+        self.address = address
+        self.endpoints = dict()
+        self.sockets = dict()
+        self.servers = dict()
+        self.clients = dict()
+        self.peers = dict()
+
+    @staticmethod
+    def pack(value):
+        return encode_layer(value)
+
+    @staticmethod
+    def unpack(value):
+        return decode_layer(value)
+
+    def bind(self, endpoint):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((self.address, 0))
+        return sock, f"http://{self.address}:{sock.getsockname()[1]}"
+
+    def register(self, endpoint):
+        # the kernel queues connections on the listening socket until uvicorn serves it
+        sock, address = self.bind(endpoint)
+        sock.listen(2048)
+
+        self.endpoints[endpoint.port] = endpoint
+        self.sockets[endpoint.port] = sock
+        self.peers[endpoint.port] = address
+
+    def peer_table(self, ports):
+        return {port: self.peers[port] for port in ports}
+
+    def add_peers(self, peers):
+        # JSON turns the ids into strings
+        self.peers.update({int(port): address for port, address in peers.items()})
+
+    def send(self, port, data, sender=None):
+        address = self.peers.get(port)
+        if address is None:
+            print(f"Error: no address known for {port}")
+            return
+
+        if address.startswith('unix://'):
+            self.post_unix(address[len('unix://'):], data)
+        else:
+            post_with_retries(
+                data=data,
+                url=f"{address}/message",
+                max_retries=3
+            )
+
+    def post_unix(self, path, data):
+        # one client per socket keeps its connections open between messages
+        client = self.clients.get(path)
+        if client is None:
+            client = httpx.Client(transport=httpx.HTTPTransport(uds=path, retries=3), timeout=None)
+            self.clients[path] = client
+
+        try:
+            client.post("http://localhost/message", json=data).raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Error: {e}")
+
+    def serve(self, endpoint):
+        app = FastAPI()
+
+        @app.post("/message")
+        def message(data: dict):
+            endpoint.deliver(data)
+            return {"status": "ok"}
+
+        server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+        self.servers[endpoint.port] = server
+        server.run(sockets=[self.sockets.pop(endpoint.port)])
+
+    def wait_until_ready(self, ports, timeout=READY_TIMEOUT):
+        # endpoints listen from the moment they register, so only their addresses have to be known
+        missing = [port for port in ports if port not in self.peers]
+        if missing:
+            raise TimeoutError(f"no address known for {missing}")
+
+    def close(self, endpoint):
+        server = self.servers.pop(endpoint.port, None)
+        if server is not None:
+            server.should_exit = True
+
+
+class UnixSocketTransport(HttpTransport):
+    """
+    HttpTransport over Unix domain sockets in a temporary folder, for runs whose endpoints all share
+    one machine. Addresses are unix://<path>, so they can be mixed with http:// peers in one table.
+    """
+
+    name = 'uds'
+
+    def __init__(self, folder=None):
+        super().__init__()
+        # a folder made here is removed again once its last endpoint has closed
+        self.temporary = folder is None
+        self.folder = folder or tempfile.mkdtemp(prefix='engine_')
+
+    def bind(self, endpoint):
+        path = os.path.join(self.folder, f'{endpoint.port}.sock')
+        if os.path.exists(path):
+            os.unlink(path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        return sock, f"unix://{path}"
+
+    def close(self, endpoint):
+        super().close(endpoint)
+        path = os.path.join(self.folder, f'{endpoint.port}.sock')
+        if os.path.exists(path):
+            os.unlink(path)
+
+        self.endpoints.pop(endpoint.port, None)
+        if self.temporary and not self.endpoints and os.path.isdir(self.folder):
+            os.rmdir(self.folder)
+
+
+class WebSocketTransport(HttpTransport):
+    """
+    Keeps one WebSocket channel open per sender and receiver pair instead of posting every message.
+    A message is a JSON header frame followed by the binary frames of its payloads, so control
+    messages and FRAME_SIZE chunks of shares share the channel, and a sender blocks while the
+    receiver's socket buffer is full.
+    """
+
+    name = 'ws'
+
+    def __init__(self, address=ADDRESS):
+        super().__init__(address)
+        self.channels = dict()
+        self.locks = dict()
+
+    @staticmethod
+    def pack(value):
+        # an .npz buffer of the arrays and a JSON outline of how they nest, nothing on the wire is pickled
+        arrays = list()
+        outline = flatten(value, arrays)
+        buffer = io.BytesIO()
+        np.savez(buffer, outline=np.array(json.dumps(outline)), **{f'array_{i}': a for i, a in enumerate(arrays)})
+        return buffer.getvalue()
+
+    @staticmethod
+    def unpack(value):
+        with np.load(io.BytesIO(value), allow_pickle=False) as buffer:
+            outline = json.loads(str(buffer['outline']))
+            arrays = [buffer[f'array_{i}'] for i in range(len(buffer.files) - 1)]
+        return unflatten(outline, arrays)
+
+    def channel(self, sender, port):
+        channel = self.channels.get((sender, port))
+        if channel is None:
+            address = self.peers[port]
+            if address.startswith('unix://'):
+                channel = unix_connect(address[len('unix://'):], uri="ws://localhost/channel", max_size=None)
+            else:
+                channel = connect(f"ws://{address[len('http://'):]}/channel", max_size=None)
+            self.channels[(sender, port)] = channel
+        return channel
+
+    def send(self, port, data, sender=None):
+        if port not in self.peers:
+            print(f"Error: no address known for {port}")
+            return
+
+        # payloads follow the header as binary frames, the header records how many frames each one has
+        header = {key: value for key, value in data.items() if not isinstance(value, bytes)}
+        payloads = {key: value for key, value in data.items() if isinstance(value, bytes)}
+        header["frames"] = {key: -(-len(value) // FRAME_SIZE) for key, value in payloads.items()}
+
+        lock = self.locks.setdefault((sender, port), threading.Lock())
+        with lock:
+            for attempt in range(2):
+                try:
+                    channel = self.channel(sender, port)
+                    channel.send(json.dumps(header))
+                    for value in payloads.values():
+                        for start in range(0, len(value), FRAME_SIZE):
+                            channel.send(value[start:start + FRAME_SIZE])
+                    return
+                except (ConnectionClosed, OSError) as e:
+                    # reopen the channel once, the receiver may have restarted
+                    self.channels.pop((sender, port), None)
+                    if attempt:
+                        print(f"Error: {e}")
+
+    def serve(self, endpoint):
+        app = FastAPI()
+
+        @app.websocket("/channel")
+        async def channel(websocket: WebSocket):
+            await websocket.accept()
+            try:
+                while True:
+                    data = await websocket.receive_json()
+                    for key, frames in data.pop("frames").items():
+                        data[key] = b''.join([await websocket.receive_bytes() for _ in range(frames)])
+                    endpoint.deliver(data)
+            except WebSocketDisconnect:
+                pass
+
+        server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+        self.servers[endpoint.port] = server
+        server.run(sockets=[self.sockets.pop(endpoint.port)])
+
+    def close(self, endpoint):
+        super().close(endpoint)
+        for sender, port in list(self.channels):
+            if sender == endpoint.port:
+                self.channels.pop((sender, port)).close()
+
+
+def flatten(value, arrays):
+    if isinstance(value, dict):
+        return {'dict': [[key, flatten(item, arrays)] for key, item in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return {'list': [flatten(item, arrays) for item in value]}
+    if isinstance(value, bytes):
+        arrays.append(np.frombuffer(value, dtype=np.uint8))
+        return {'bytes': len(arrays) - 1}
+    if isinstance(value, (np.ndarray, np.generic)):
+        arrays.append(np.asarray(value))
+        return {'array': len(arrays) - 1}
+    return {'value': value}
+
+
+def unflatten(outline, arrays):
+    if 'dict' in outline:
+        return {key: unflatten(item, arrays) for key, item in outline['dict']}
+    if 'list' in outline:
+        return [unflatten(item, arrays) for item in outline['list']]
+    if 'bytes' in outline:
+        return arrays[outline['bytes']].tobytes()
+    if 'array' in outline:
+        return arrays[outline['array']]
+    return outline['value']
+
+
+class InMemoryTransport:
+    """
+    Routes messages straight into the receiving endpoint's inbox, payloads are passed as objects.
+    Ports are only used as node ids, so the number of nodes is not limited by free ports.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self.endpoints = dict()
+        self.stopped = dict()
+
+    @staticmethod
+    def pack(value):
+        return value
+
+    @staticmethod
+    def unpack(value):
+        return value
+
+    def register(self, endpoint):
+        self.endpoints[endpoint.port] = endpoint
+        self.stopped[endpoint.port] = threading.Event()
+
+    def peer_table(self, ports):
+        # every endpoint lives in this process, there are no addresses to distribute
+        return dict()
+
+    def add_peers(self, peers):
+        pass
+
+    def send(self, port, data, sender=None):
+        endpoint = self.endpoints.get(port)
+        if endpoint is None:
+            print(f"Error: no endpoint registered for {port}")
+            return
+        endpoint.deliver(data)
+
+    def serve(self, endpoint):
+        # block like uvicorn does until the endpoint is closed
+        self.stopped[endpoint.port].wait()
+
+    def wait_until_ready(self, ports, timeout=READY_TIMEOUT):
+        # endpoints are reachable as soon as they are registered
+        missing = [port for port in ports if port not in self.endpoints]
+        if missing:
+            raise TimeoutError(f"no endpoint registered for {missing}")
+
+    def close(self, endpoint):
+        self.stopped[endpoint.port].set()
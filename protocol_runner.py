@@ -0,0 +1,113 @@
+import argparse
+import threading
+
+from protocol.server import ProtocolServer
+from protocol.datasets import SharedDataset
+from protocol.hosting import create_nodes, start_endpoints, start_workers
+from protocol.pipeline import build_pipeline, SHARERS, CIPHERS, TRANSPORTS, AGGREGATORS, MODELS, SAMPLERS
+
+from helpers.utils import fetch_index
+from helpers.constants import SERVER_PORT, CLIENT_PORT, NODES, DATASETS
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run a federated experiment from a combination of protocol stages.")
+    parser.add_argument("dataset", choices=DATASETS)
+    parser.add_argument("--selector", default="full", help="full, random, magnitude, obd, l1 or l2")
+    parser.add_argument("--sharer", default="additive", choices=list(SHARERS))
+    parser.add_argument("--cipher", default="plain", choices=list(CIPHERS))
+    parser.add_argument("--transport", default="http", choices=list(TRANSPORTS))
+    parser.add_argument("--aggregator", default="fedavg", choices=list(AGGREGATORS))
+    parser.add_argument("--model", default="lenet5", choices=list(MODELS))
+    parser.add_argument("--groups", type=int, default=0, help="group size, 0 shares with every node")
+    parser.add_argument("--pipelined", action="store_true", help="exchange and reassemble shares layer by layer")
+    parser.add_argument("--nodes", type=int, default=NODES)
+    parser.add_argument("--sampler", default="all", choices=list(SAMPLERS))
+    parser.add_argument("--sample-size", type=int, default=0, help="nodes sampled per round, 0 takes every node")
+    parser.add_argument("--deadline", type=float, default=None, help="seconds a phase waits before the round goes on "
+                                                                      "without the nodes that have not answered")
+    parser.add_argument("--quorum", type=float, default=None, help="fraction of the nodes whose training ends the "
+                                                                   "training phase")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes hosting the nodes, 0 runs them "
+                                                                "as threads of this process")
+    parser.add_argument("--intra-op-threads", type=int, default=0, help="TF intra-op threads per worker, 0 splits "
+                                                                        "the cores between workers")
+    parser.add_argument("--inter-op-threads", type=int, default=1, help="TF inter-op threads per worker")
+    args = parser.parse_args()
+
+    if args.workers and args.transport == 'memory':
+        parser.error("the memory transport cannot reach nodes hosted in worker processes")
+
+    if args.aggregator == 'fedasync' and args.sharer != 'none':
+        parser.error("secret sharing needs synchronous rounds, use --sharer none with fedasync")
+
+    if args.sharer == 'ring' and args.groups:
+        parser.error("the ring sums over the whole cohort and cannot be combined with --groups")
+
+    if args.sharer == 'ring' and (args.deadline or args.quorum):
+        parser.error("the ring is not restarted when a node drops out and cannot be combined with --deadline "
+                     "or --quorum")
+
+    DATASET = args.dataset
+    options = {
+        "selector": args.selector,
+        "sharer": args.sharer,
+        "cipher": args.cipher,
+        "transport": args.transport,
+        "aggregator": args.aggregator,
+        "model": args.model,
+        "group_size": args.groups,
+        "pipelined": args.pipelined,
+        "sampler": args.sampler,
+        "sample_size": args.sample_size,
+    }
+    pipeline = build_pipeline(**options)
+    print(f"DATASET: {DATASET}, PIPELINE: {pipeline.name}, WORKERS: {args.workers}")
+
+    indexes = fetch_index(DATASET)
+    shared_dataset = SharedDataset.create(DATASET)
+
+    # ports are only ids, endpoints bind ephemeral ports and are reached through the peer table
+    ports = [CLIENT_PORT + i for i in range(1, args.nodes + 1)]
+    threads = []
+    processes = []
+
+    _, _, X_test, Y_test = shared_dataset.partition(indexes[0])
+    server = ProtocolServer(
+        port=SERVER_PORT,
+        pipeline=pipeline,
+        dataset=DATASET,
+        x_test=X_test,
+        y_test=Y_test,
+        deadline=args.deadline,
+        quorum=args.quorum
+    )
+    server_thread = threading.Thread(target=server.start)
+    server_thread.start()
+
+    if args.workers:
+        processes, peers = start_workers(
+            options,
+            shared_dataset,
+            ports,
+            pipeline.transport.peer_table([SERVER_PORT]),
+            args.workers,
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads
+        )
+        pipeline.transport.add_peers(peers)
+    else:
+        nodes = create_nodes(pipeline, DATASET, ports, indexes, shared_dataset)
+        threads = start_endpoints(nodes)
+
+    # the round starts as soon as every endpoint accepts messages
+    pipeline.transport.wait_until_ready([SERVER_PORT] + ports)
+    server.start_round(ports)
+
+    server_thread.join()
+    for t in threads:
+        t.join()
+    for process in processes:
+        process.join()
+
+    shared_dataset.remove()
@@ -52,6 +52,10 @@ class ScotchNode:
             if data["message"] == MESSAGE_SCOTCH_SHARE:
                 self.accept_shares(data['model_share'])
 
+                # a share the servers have already summed among themselves is the whole aggregate
+                if data.get("reduced"):
+                    self.reassemble_shares(expected=1)
+
             elif data["message"] == MESSAGE_START_ASSEMBLY:
                 self.reassemble_shares()
 
@@ -76,6 +80,7 @@ class ScotchNode:
 
     def start_training(self, data=None):
         self.round += 1
+        self.secret_sharing_time = 0.0
         cb = TimingCallback()
 
         self.model.compile(optimizer=self.optimizer, loss='categorical_crossentropy', metrics=['accuracy'])
@@ -126,7 +131,7 @@ class ScotchNode:
 
             self.send_to_node(data=data, address=ADDRESS, port=server)
 
-        self.secret_sharing_time = timer() - self.start_time
+        self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
 
     def accept_shares(self, data):
 
@@ -138,10 +143,10 @@ class ScotchNode:
 
         self.secret_sharing_time = self.secret_sharing_time + (timer() - self.start_time)
 
-    def reassemble_shares(self):
+    def reassemble_shares(self, expected=None):
         self.share_count += 1
 
-        if self.share_count == len(self.scotch_servers):
+        if self.share_count == (expected or len(self.scotch_servers)):
             self.share_count = 0
 
             self.start_time = timer()
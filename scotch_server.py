@@ -1,28 +1,30 @@
 import os
 import time
 import uvicorn
+import threading
 import numpy as np
-import pandas as pd
 import tensorflow as tf
 from fastapi import FastAPI
 from timeit import default_timer as timer
 
 from helpers.utils import check_port, terminate_process_on_port, combine_csv_files
 from helpers.utils import post_with_retries, encode_layer, decode_layer, get_lenet5_classification, get_private_key
+from helpers.topology import ShareAllReduce
+from helpers.metrics import MetricsWriter
 
 from helpers.constants import MESSAGE_SCOTCH_SHARE, ADDRESS, MESSAGE_MODEL_SHARE
 from helpers.constants import MESSAGE_START_ASSEMBLY, SERVER_PORT, ROUNDS, MESSAGE_ASSEMBLY_COMPLETED
+from helpers.constants import MESSAGE_REDUCE_SHARE, STAR
 
 
 class ScotchServer:
 
-    def __init__(self, address, port, max_nodes, client_type, dataset, x_test, y_test):
+    def __init__(self, address, port, max_nodes, client_type, dataset, x_test, y_test, servers=None, topology=STAR):
         self.app = FastAPI()
         self.port = port
         self.address = address
         self.connected_nodes = 0
         self.max_nodes = max_nodes
-        self.scotch_servers = list()
 
         self.start_time = None
         self.end_time = None
@@ -38,14 +40,28 @@ class ScotchServer:
 
         self.record = list()
         self.current_accuracy = 0
+
+        # every round's record is appended to a log, which becomes the server csv at the end
+        current_dir = os.path.dirname(os.path.realpath(__file__))
+        self.output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
+        self.metrics = MetricsWriter(os.path.join(self.output_folder, f'server_{self.port - SERVER_PORT}.jsonl'))
+        self.metrics.clear()
         self.threshold = 0
         self.share_count = 0
 
         self.shares = dict()
         self.nodes = []
+        self.lock = threading.Lock()
 
         self.private_key = get_private_key('server')
 
+        # with a tree or ring the servers sum their shares among themselves, and each sends the
+        # total to its own slice of the nodes instead of every server sending to every node
+        self.scotch_servers = servers or [port]
+        self.reducer = None
+        if topology != STAR:
+            self.reducer = ShareAllReduce(self.port, self.scotch_servers, topology, self.send_to_node, self.reduced)
+
         @self.app.post("/message")
         def message(data: dict):
             print(f"SERVER RECEIVED ({self.port}): {data['message']} from PORT: {data['port']}")
@@ -54,6 +70,8 @@ class ScotchServer:
                 self.accept_shares(data["model_share"])
             elif data["message"] == MESSAGE_ASSEMBLY_COMPLETED:
                 self.end_round()
+            elif data["message"] == MESSAGE_REDUCE_SHARE:
+                self.reducer.receive(data)
 
             return {"status": "ok"}
 
@@ -89,16 +107,21 @@ class ScotchServer:
     def accept_shares(self, data):
 
         self.start_time = timer()
-        for layer in data.keys():
-            weight_bias = decode_layer(data[layer])
-            self.shares[layer][0].append(weight_bias[0])
-            self.shares[layer][1].append(weight_bias[1])
+        layer_weights = {layer: decode_layer(data[layer]) for layer in data.keys()}
+
+        # nodes send their shares concurrently
+        with self.lock:
+            for layer, weight_bias in layer_weights.items():
+                self.shares[layer][0].append(weight_bias[0])
+                self.shares[layer][1].append(weight_bias[1])
 
-        self.share_count += 1
+            self.share_count += 1
+            complete = self.share_count == len(self.nodes)
+            if complete:
+                self.share_count = 0
 
-        if self.share_count == len(self.nodes):
+        if complete:
             # print(f"RECEIVED SHARES (SERVER {self.port}): {self.share_count}")
-            self.share_count = 0
             self.reassemble_shares()
 
     def reassemble_shares(self):
@@ -117,15 +140,25 @@ class ScotchServer:
                 self.average_weights[layer][1] += temp_weight_bias[1] / len(self.nodes)
 
         model_weights = dict()
+        layer_weights = dict()
         for layer in self.global_model.layers:
             if layer.trainable_weights:
                 layer.set_weights(self.average_weights[layer.name])
                 model_weights[layer.name] = encode_layer(self.average_weights[layer.name])
+                layer_weights[layer.name] = self.average_weights[layer.name]
                 self.shares[layer.name] = [[], []]
                 self.average_weights[layer] = [None, None]
 
         self.evaluate()
 
+        if self.reducer is not None:
+            self.reducer.reduce(layer_weights)
+
+        # the nodes go on to their next round by themselves, the server's round ends with its reassembly
+        self.round += 1
+        if self.round == self.max_rounds:
+            self.end_session()
+
         # for node in self.nodes:
         #     data = {
         #         "port": self.port,
@@ -136,6 +169,16 @@ class ScotchServer:
         #
         # self.end_round()
 
+    def reduced(self, layer_weights):
+        data = {
+            "port": self.port,
+            "message": MESSAGE_SCOTCH_SHARE,
+            "model_share": {layer: encode_layer(weight_bias) for layer, weight_bias in layer_weights.items()},
+            "reduced": True,
+        }
+        for node in self.nodes[self.scotch_servers.index(self.port)::len(self.scotch_servers)]:
+            self.send_to_node(data, node)
+
     def evaluate(self):
         # print(f"RECEIVED SHARES (SERVER {self.port}): {len(self.shares['conv2d_0'][0])}")
         self.global_model.compile(optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=0.001),
@@ -151,23 +194,21 @@ class ScotchServer:
             'accuracy': self.current_accuracy,
             'fl': self.end_time,
         })
+        self.metrics.write(self.record[-1])
 
     def end_round(self):
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
-        os.makedirs(output_folder, exist_ok=True)
-        csv_filename = f'server_{self.port - SERVER_PORT}.csv'
-        csv_path = os.path.join(output_folder, csv_filename)
-        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
-        combine_csv_files(f"{self.client_type}", f"{self.dataset}")
-
         print("ROUND ENDED")
 
-        self.round += 1
-        if self.round <= self.max_rounds:
+        if self.round < self.max_rounds:
             for node in self.nodes:
                 data = {
                     "port": self.port,
                     "message": MESSAGE_START_ASSEMBLY,
                 }
                 self.send_to_node(data, node)
+
+    def end_session(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        csv_filename = f'server_{self.port - SERVER_PORT}.csv'
+        self.metrics.export(os.path.join(self.output_folder, csv_filename))
+        combine_csv_files(f"{self.client_type}", f"{self.dataset}")
@@ -1,8 +1,7 @@
-import time
 import threading
 
-from helpers.utils import get_dataset, fetch_index, fetch_dataset
-from helpers.constants import SERVER_PORT, NODES, ADDRESS, CLIENT_PORT
+from helpers.utils import get_dataset, fetch_index, fetch_dataset, wait_for_ports
+from helpers.constants import SERVER_PORT, NODES, ADDRESS, CLIENT_PORT, STAR
 
 from scotch import ScotchNode
 from scotch_server import ScotchServer
@@ -11,6 +10,7 @@ if __name__ == "__main__":
 
     DATASET = "mnist"  # str(sys.argv[1])
     SERVERS = 5  # int(sys.argv[2])
+    TOPOLOGY = STAR  # str(sys.argv[3])
 
     print(f"DATASET: {DATASET}")
     print(f"SERVERS: {SERVERS}")
@@ -18,7 +18,8 @@ if __name__ == "__main__":
     indexes = fetch_index(DATASET)
     (X_train, Y_train), (X_test, Y_test) = fetch_dataset(DATASET)
     servers, nodes = [], []
-    server_ports, node_ports = [], []
+    server_ports = [SERVER_PORT + i for i in range(1, SERVERS + 1)]
+    node_ports = []
     threads = []
 
     for i in range(1, SERVERS + 1):
@@ -37,10 +38,11 @@ if __name__ == "__main__":
             client_type=f'scotch_{SERVERS}',
             dataset=DATASET,
             x_test=x_train,
-            y_test=y_train
+            y_test=y_train,
+            servers=server_ports,
+            topology=TOPOLOGY
         )
 
-        server_ports.append(SERVER_PORT + i)
         servers.append(server)
 
     for i in range(1, NODES + 1):
@@ -67,20 +69,22 @@ if __name__ == "__main__":
         nodes.append(node)
 
     for server in servers:
-        time.sleep(2)
         t = threading.Thread(target=server.start, args=(node_ports,))
         t.start()
         threads.append(t)
 
     for node in nodes:
-        time.sleep(2)
         t = threading.Thread(target=node.start, args=(server_ports,))
         t.start()
         threads.append(t)
 
+    wait_for_ports(ADDRESS, server_ports + node_ports)
+
+    # nodes train concurrently, the round is as long as the slowest node
     for node in nodes:
-        time.sleep(2)
-        node.start_training()
+        t = threading.Thread(target=node.start_training)
+        t.start()
+        threads.append(t)
 
     for t in threads:
         t.join()
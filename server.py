@@ -9,6 +9,9 @@ from timeit import default_timer as timer
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 
+from helpers.barrier import RoundBarrier
+from helpers.checkpoint import RoundCheckpoint, resume_record
+from helpers.metrics import MetricsWriter, read_metrics
 from helpers.utils import post_with_retries, encode_layer, decode_layer, get_lenet5_classification, get_private_key
 from helpers.utils import check_port, terminate_process_on_port, get_dataset, combine_csv_files, NumpyDecoder
 
@@ -30,7 +33,6 @@ class Server:
 
         self.start_time = None
         self.end_time = None
-        self.pending_nodes = set()
         self.average_weights = dict()
         _, _, self.X_test, self.y_test = get_dataset(
             indexes[0],
@@ -44,7 +46,7 @@ class Server:
         self.global_model = get_lenet5_classification(dataset)
         self.max_rounds = ROUNDS
         self.round = 0
-        self.training_completed_count = 0
+        self.barrier = RoundBarrier()
         self.client_type = client_type
         self.dataset = dataset
 
@@ -54,6 +56,11 @@ class Server:
 
         self.private_key = get_private_key('server')
 
+        current_dir = os.path.dirname(os.path.realpath(__file__))
+        output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
+        self.checkpoint = RoundCheckpoint(os.path.join(output_folder, 'server.npz'))
+        self.metrics = MetricsWriter(os.path.join(output_folder, 'server.jsonl'))
+
         @self.app.post("/message")
         def message(data: dict):
             print(f"SERVER RECEIVED: {data['message']} from PORT: {data['port']}")
@@ -62,7 +69,7 @@ class Server:
                 self.fl_update(data["port"], data["model_weights"], data["message"])
 
             elif data["message"] == MESSAGE_TRAINING_COMPLETED:
-                self.start_secret_sharing()
+                self.start_secret_sharing(data["port"])
 
             elif data["message"] == MESSAGE_SHARING_COMPLETE:
                 self.start_assembly(data["port"])
@@ -93,17 +100,17 @@ class Server:
             )
 
     def check_current_round(self):
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
-        csv_filename = 'server.csv'
-        csv_path = os.path.join(output_folder, csv_filename)
-
-        if os.path.exists(csv_path):
-            server_records = pd.read_csv(csv_path)
-            self.round = server_records['round'].max()
-            self.record = server_records.to_dict('records')
+        # a run that stopped early resumes from the global model of its last completed round
+        checkpoint = self.checkpoint.load()
+        if checkpoint is not None and checkpoint['round'] < self.max_rounds:
+            self.round = checkpoint['round']
+            self.record = resume_record(checkpoint, read_metrics(self.metrics.path))
+            self.metrics.rewrite(self.record)
+            self.global_model.set_weights(checkpoint['weights'])
+            print(f"Resuming after round ({self.round})")
         else:
             self.round = 0
+            self.metrics.clear()
 
     def start_round(self, nodes=None):
         if nodes:
@@ -112,7 +119,9 @@ class Server:
         print(f'Starting round ({self.round + 1})')
 
         self.start_time = timer()
-        self.pending_nodes = self.nodes.copy()
+        self.barrier.reset()
+        self.barrier.open('training', self.nodes)
+        self.barrier.open('update', self.nodes)
         for layer in self.global_model.layers:
             if layer.trainable_weights:
                 self.average_weights[layer.name] = [[], []]
@@ -121,6 +130,7 @@ class Server:
             "port": "SERVER",
             "nodes": self.nodes,
             "message": MESSAGE_START_TRAINING,
+            "round": self.round + 1,
             "model_architecture": self.global_model.to_json(),
             "model_weights": encode_layer(self.global_model.get_weights()),
         }
@@ -167,8 +177,7 @@ class Server:
                 else:
                     self.average_weights[layer][0] += temp_weight[0] / len(self.nodes)
                     self.average_weights[layer][1] += temp_weight[1] / len(self.nodes)
-        self.pending_nodes.remove(node)
-        if not self.pending_nodes:
+        if self.barrier.arrive('update', node):
             self.apply_updates()
 
     def apply_updates(self):
@@ -189,14 +198,12 @@ class Server:
             'round': self.round + 1,
             'accuracy': self.current_accuracy,
             'fl': self.end_time,
+            **self.barrier.latencies(),
         })
 
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        output_folder = current_dir + f"/resources/results/{self.client_type}/{self.dataset}"
-        os.makedirs(output_folder, exist_ok=True)
-        csv_filename = 'server.csv'
-        csv_path = os.path.join(output_folder, csv_filename)
-        pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
+        # the round's metrics are appended in the background, server.csv is written once at the end
+        self.metrics.write(self.record[-1])
+        self.checkpoint.save(self.round + 1, self.global_model.get_weights(), row=self.record[-1])
 
         self.end_round()
 
@@ -222,22 +229,24 @@ class Server:
         csv_filename = 'server.csv'
         csv_path = os.path.join(output_folder, csv_filename)
         pd.DataFrame(self.record).to_csv(csv_path, index=False, header=True)
+        self.metrics.flush()
 
         self.send_to_node(data)
         combine_csv_files(f"{self.client_type}", f"{self.dataset}")
+        self.checkpoint.flush()
         terminate_process_on_port(self.port)
 
     def start_assembly(self, port):
+        self.barrier.arrive('sharing', port)
         data = {
             "port": "SERVER",
             "message": MESSAGE_START_ASSEMBLY,
         }
         self.send_to_node(data, port=port)
 
-    def start_secret_sharing(self):
-        self.training_completed_count += 1
-        if self.training_completed_count == len(self.nodes):
-            self.training_completed_count = 0
+    def start_secret_sharing(self, port):
+        if self.barrier.arrive('training', port):
+            self.barrier.open('sharing', self.nodes)
             data = {
                 "port": "SERVER",
                 "message": MESSAGE_START_SECRET_SHARING,
@@ -7,6 +7,9 @@ import tensorflow as tf
 from fastapi import FastAPI
 from timeit import default_timer as timer
 
+from helpers.barrier import RoundBarrier
+from helpers.checkpoint import RoundCheckpoint, resume_record
+from helpers.metrics import MetricsWriter, read_metrics
 from helpers import constants
 from helpers.utils import check_port, terminate_process_on_port, get_dataset, combine_find_mean
 from helpers.utils import random_weight_selection, magnitude_weight_selection, obd_weight_selection
@@ -25,7 +28,6 @@ class ServerAddsharePlus:
 
         self.start_time = None
         self.end_time = None
-        self.pending_nodes = set()
         self.average_weights = dict()
         _, _, self.X_test, self.y_test = get_dataset(
             indexes[0],
@@ -39,7 +41,7 @@ class ServerAddsharePlus:
         self.global_model = get_lenet5_classification(dataset)
         self.max_rounds = constants.ROUNDS
         self.round = 0
-        self.training_completed_count = 0
+        self.barrier = RoundBarrier()
         self.client_type = client_type
         self.pruning_type = pruning_type
         self.dataset = dataset
@@ -47,19 +49,22 @@ class ServerAddsharePlus:
         self.record = list()
         self.current_accuracy = 0
         self.threshold = 0
+        self.resumed_indexes = dict()
+
+        current_dir = os.path.dirname(os.path.realpath(__file__))
+        output_folder = current_dir + f"/resources/results/{self.client_type}_{self.pruning_type}/{self.dataset}"
+        self.checkpoint = RoundCheckpoint(os.path.join(output_folder, 'server.npz'))
+        self.metrics = MetricsWriter(os.path.join(output_folder, 'server.jsonl'))
 
         @self.app.post("/message")
         def message(data: dict):
             print(f"SERVER RECEIVED: {data['message']} from PORT: {data['port']}")
 
             if data["message"] == constants.MESSAGE_FL_UPDATE:
-                self.fl_update(data["port"], data["model_weights"])
+                self.fl_update(data["port"], data["model_weights"], data.get("shares"))
 
             elif data["message"] == constants.MESSAGE_TRAINING_COMPLETED:
-                self.start_secret_sharing()
-
-            elif data["message"] == constants.MESSAGE_SHARING_COMPLETE:
-                self.start_assembly(data["port"])
+                self.start_secret_sharing(data["port"])
 
             return {"status": "ok"}
 
@@ -67,6 +72,7 @@ class ServerAddsharePlus:
         if check_port(self.address, self.port):
             terminate_process_on_port(self.port)
 
+        self.check_current_round()
         uvicorn.run(self.app, host="0.0.0.0", port=self.port)
 
     def send_to_node(self, data, port=None):
@@ -85,6 +91,19 @@ class ServerAddsharePlus:
                 max_retries=3
             )
 
+    def check_current_round(self):
+        # a run that stopped early resumes from the global model of its last completed round
+        checkpoint = self.checkpoint.load()
+        if checkpoint is not None and checkpoint['round'] < self.max_rounds:
+            self.round = checkpoint['round']
+            self.record = resume_record(checkpoint, read_metrics(self.metrics.path))
+            self.metrics.rewrite(self.record)
+            self.global_model.set_weights(checkpoint['weights'])
+            self.resumed_indexes = checkpoint['indexes'] or dict()
+            print(f"Resuming after round ({self.round})")
+        else:
+            self.metrics.clear()
+
     def start_round(self, nodes=None):
         if nodes:
             self.nodes = nodes
@@ -92,11 +111,17 @@ class ServerAddsharePlus:
         print(f'Starting round ({self.round + 1})')
 
         indexes = {}
+        resumed, self.resumed_indexes = self.resumed_indexes, dict()
         self.start_time = timer()
-        self.pending_nodes = self.nodes.copy()
+        self.barrier.reset()
+        self.barrier.open('training', self.nodes)
+        self.barrier.open('update', self.nodes)
         for layer in self.global_model.layers:
             if layer.trainable_weights:
-                if self.pruning_type == constants.RANDOM:
+                if layer.name in resumed:
+                    # an interrupted round shares the weights it had selected before
+                    indexes[layer.name] = resumed[layer.name]
+                elif self.pruning_type == constants.RANDOM:
                     kernel_indices = random_weight_selection(layer.get_weights()[0], constants.THRESHOLD)
                     bias_indices = random_weight_selection(layer.get_weights()[1], constants.THRESHOLD)
                     indexes[layer.name] = [kernel_indices, bias_indices]
@@ -140,17 +165,26 @@ class ServerAddsharePlus:
                     indexes[layer.name] = [kernel_indices, bias_indices]
                 self.average_weights[layer.name] = [[], []]
 
+        # the checkpoint holds the model a round starts from and the weights it shares
+        self.checkpoint.save(self.round, self.global_model.get_weights(), indexes, self.last_row())
+
         data = {
             "port": "SERVER",
             "nodes": self.nodes,
             "message": constants.MESSAGE_START_TRAINING,
+            "round": self.round + 1,
             "indexes": json.dumps(indexes),
             "model_architecture": self.global_model.to_json(),
             "model_weights": encode_layer(self.global_model.get_weights()),
         }
         self.send_to_node(data)
 
-    def fl_update(self, node, data):
+    def fl_update(self, node, data, shares=None):
+        # nodes reassemble on their own once every share is in, the update says how many they summed
+        if shares is not None and shares != len(self.nodes):
+            print(f"Ignoring update from PORT: {node}, it sums {shares} of {len(self.nodes)} shares")
+            return
+        self.barrier.arrive('sharing', node)
 
         for layer in data.keys():
             temp_weight = decode_layer(data[layer])
@@ -162,8 +196,7 @@ class ServerAddsharePlus:
                 self.average_weights[layer][0] += temp_weight[0] / len(self.nodes)
                 self.average_weights[layer][1] += temp_weight[1] / len(self.nodes)
 
-        self.pending_nodes.remove(node)
-        if not self.pending_nodes:
+        if self.barrier.arrive('update', node):
             self.apply_updates()
 
     def apply_updates(self):
@@ -184,7 +217,9 @@ class ServerAddsharePlus:
             'round': self.round + 1,
             'accuracy': self.current_accuracy,
             'fl': self.end_time,
+            **self.barrier.latencies(),
         })
+        self.metrics.write(self.record[-1])
         self.end_round()
 
     def end_round(self):
@@ -212,19 +247,17 @@ class ServerAddsharePlus:
 
         self.send_to_node(data)
         combine_find_mean(f"{self.client_type}_{self.pruning_type}", f"{self.dataset}")
+        self.checkpoint.save(self.round, self.global_model.get_weights(), row=self.last_row())
+        self.checkpoint.flush()
+        self.metrics.flush()
         terminate_process_on_port(self.port)
 
-    def start_assembly(self, port):
-        data = {
-            "port": "SERVER",
-            "message": constants.MESSAGE_START_ASSEMBLY,
-        }
-        self.send_to_node(data, port=port)
+    def last_row(self):
+        return self.record[-1] if self.record else None
 
-    def start_secret_sharing(self):
-        self.training_completed_count += 1
-        if self.training_completed_count == len(self.nodes):
-            self.training_completed_count = 0
+    def start_secret_sharing(self, port):
+        if self.barrier.arrive('training', port):
+            self.barrier.open('sharing', self.nodes)
             data = {
                 "port": "SERVER",
                 "message": constants.MESSAGE_START_SECRET_SHARING,
@@ -7,7 +7,8 @@ import tensorflow as tf
 from fastapi import FastAPI
 from timeit import default_timer as timer
 
-from helpers.utils import check_port, terminate_process_on_port, get_dataset, combine_find_mean
+from helpers.barrier import RoundBarrier
+from helpers.utils import check_port, terminate_process_on_port, get_dataset, combine_find_mean, generate_groups
 from helpers.utils import random_weight_selection, magnitude_weight_selection, obd_weight_selection
 from helpers.utils import post_with_retries, encode_layer, decode_layer, get_lenet5_classification, regularization_weight_selection
 
@@ -27,7 +28,6 @@ class ServerAddsharePlusNodeSubGroup:
 
         self.start_time = None
         self.end_time = None
-        self.pending_nodes = set()
         self.average_weights = dict()
         _, _, self.X_test, self.y_test = get_dataset(
             indexes[0],
@@ -41,11 +41,11 @@ class ServerAddsharePlusNodeSubGroup:
         self.global_model = get_lenet5_classification(dataset)
         self.max_rounds = constants.ROUNDS
         self.round = 0
-        self.training_completed_count = 0
-        self.sharing_completed_count = 0
+        self.barrier = RoundBarrier()
         self.client_type = client_type
         self.pruning_type = pruning_type
         self.group_size = group_size
+        self.groupings = list()
         self.dataset = dataset
         self.record = list()
         self.current_accuracy = 0
@@ -59,7 +59,7 @@ class ServerAddsharePlusNodeSubGroup:
                 self.fl_update(data["port"], data["model_weights"])
 
             elif data["message"] == constants.MESSAGE_TRAINING_COMPLETED:
-                self.start_secret_sharing()
+                self.start_secret_sharing(data["port"])
 
             elif data["message"] == constants.MESSAGE_SHARING_COMPLETE:
                 self.start_assembly(data["port"])
@@ -95,8 +95,13 @@ class ServerAddsharePlusNodeSubGroup:
         print(f'Starting round ({self.round + 1})')
 
         indexes = {}
+        self.groupings = generate_groups(self.nodes, self.group_size)
+
         self.start_time = timer()
-        self.pending_nodes = self.nodes.copy()
+        self.barrier.reset()
+        for i, group in enumerate(self.groupings):
+            self.barrier.open(f'training_{i}', group)
+        self.barrier.open('update', self.nodes)
         for layer in self.global_model.layers:
             if layer.trainable_weights:
                 if self.pruning_type == constants.RANDOM:
@@ -145,13 +150,15 @@ class ServerAddsharePlusNodeSubGroup:
 
         data = {
             "port": "SERVER",
-            "nodes": self.nodes,
             "indexes": json.dumps(indexes),
             "message": constants.MESSAGE_START_TRAINING,
             "model_architecture": self.global_model.to_json(),
             "model_weights": encode_layer(self.global_model.get_weights()),
         }
-        self.send_to_node(data)
+        # every node shares with the members of its own group
+        for port in self.nodes:
+            data["nodes"] = list(set(val for group in self.groupings if port in group for val in group))
+            self.send_to_node(data, port=port)
 
     def fl_update(self, node, data):
 
@@ -165,8 +172,7 @@ class ServerAddsharePlusNodeSubGroup:
                 self.average_weights[layer][0] += temp_weight[0] / len(self.nodes)
                 self.average_weights[layer][1] += temp_weight[1] / len(self.nodes)
 
-        self.pending_nodes.remove(node)
-        if not self.pending_nodes:
+        if self.barrier.arrive('update', node):
             self.apply_updates()
 
     def apply_updates(self):
@@ -187,6 +193,7 @@ class ServerAddsharePlusNodeSubGroup:
             'round': self.round + 1,
             'accuracy': self.current_accuracy,
             'fl': self.end_time,
+            **self.barrier.latencies(),
         })
         self.end_round()
 
@@ -217,22 +224,27 @@ class ServerAddsharePlusNodeSubGroup:
         combine_find_mean(f"{self.client_type}_{self.pruning_type}_{self.group_size}", f"{self.dataset}")
         terminate_process_on_port(self.port)
 
+    def group_of(self, port):
+        return next(i for i, group in enumerate(self.groupings) if port in group)
+
     def start_assembly(self, port):
-        self.sharing_completed_count += 1
-        if self.sharing_completed_count == len(self.nodes):
-            self.sharing_completed_count = 0
+        # every group reassembles as soon as its own members have shared, without waiting for the other groups
+        i = self.group_of(port)
+        if self.barrier.arrive(f'sharing_{i}', port):
             data = {
                 "port": "SERVER",
                 "message": constants.MESSAGE_START_ASSEMBLY,
             }
-            self.send_to_node(data)
+            for node in self.groupings[i]:
+                self.send_to_node(data, port=node)
 
-    def start_secret_sharing(self):
-        self.training_completed_count += 1
-        if self.training_completed_count == len(self.nodes):
-            self.training_completed_count = 0
+    def start_secret_sharing(self, port):
+        i = self.group_of(port)
+        if self.barrier.arrive(f'training_{i}', port):
+            self.barrier.open(f'sharing_{i}', self.groupings[i])
             data = {
                 "port": "SERVER",
                 "message": constants.MESSAGE_START_SECRET_SHARING,
             }
-            self.send_to_node(data)
+            for node in self.groupings[i]:
+                self.send_to_node(data, port=node)
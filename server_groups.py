@@ -6,18 +6,19 @@ import tensorflow as tf
 from fastapi import FastAPI
 from timeit import default_timer as timer
 
+from helpers.barrier import RoundBarrier
 from helpers.utils import post_with_retries, encode_layer, decode_layer, get_lenet5_classification, get_dataset
 from helpers.utils import check_port, terminate_process_on_port, generate_groups, combine_csv_files
 
 from helpers.constants import MESSAGE_TRAINING_COMPLETED, MESSAGE_START_SECRET_SHARING
 from helpers.constants import MESSAGE_END_SESSION, MESSAGE_START_ASSEMBLY, MESSAGE_FL_UPDATE
-from helpers.constants import MESSAGE_SHARING_COMPLETE, ROUNDS, MESSAGE_START_TRAINING, ADDRESS
+from helpers.constants import MESSAGE_SHARING_COMPLETE, ROUNDS, MESSAGE_START_TRAINING, ADDRESS, HIERARCHICAL
 
 
 class ServerSubGroup:
     def __init__(self, server_id, address, port, max_nodes, client_type, group_size, dataset, indexes, x_train, y_train,
                  x_test,
-                 y_test):
+                 y_test, hierarchical=HIERARCHICAL):
         self.id = server_id
         self.app = FastAPI()
         self.port = port
@@ -29,7 +30,6 @@ class ServerSubGroup:
         self.grouping_time = None
         self.start_time = None
         self.end_time = None
-        self.pending_nodes = set()
         self.average_weights = dict()
         _, _, self.X_test, self.y_test = get_dataset(
             indexes[0],
@@ -43,11 +43,12 @@ class ServerSubGroup:
         self.global_model = get_lenet5_classification(dataset)
         self.max_rounds = ROUNDS
         self.round = 0
-        self.training_completed_count = 0
+        self.barrier = RoundBarrier()
         self.client_type = client_type
         self.group_size = group_size
         self.dataset = dataset
         self.groupings = list()
+        self.hierarchical = hierarchical
         self.record = list()
         self.current_accuracy = 0
         self.threshold = 0
@@ -60,7 +61,7 @@ class ServerSubGroup:
                 self.fl_update(data["port"], data["model_weights"])
 
             elif data["message"] == MESSAGE_TRAINING_COMPLETED:
-                self.start_secret_sharing()
+                self.start_secret_sharing(data["port"])
 
             elif data["message"] == MESSAGE_SHARING_COMPLETE:
                 self.start_assembly(data["port"])
@@ -78,7 +79,9 @@ class ServerSubGroup:
             if data["message"] == MESSAGE_START_TRAINING:
                 # if it's a start training message, then send ports to which the nodes belong to
                 for port in self.nodes:
-                    data["nodes"] = list(set(val for group in self.groupings if id in group for val in group))
+                    data["nodes"] = list(set(val for group in self.groupings if port in group for val in group))
+                    if self.hierarchical:
+                        data["aggregator"] = min(data["nodes"])
                     post_with_retries(
                         data=data,
                         url=f"http://{ADDRESS}:{port}/message",
@@ -112,7 +115,9 @@ class ServerSubGroup:
         self.grouping_time = temp_start_time - timer()
 
         self.start_time = timer()
-        self.pending_nodes = self.nodes.copy()
+        self.barrier.reset()
+        self.barrier.open('training', self.nodes)
+        self.barrier.open('update', self.update_senders())
         for layer in self.global_model.layers:
             if layer.trainable_weights:
                 self.average_weights[layer.name] = [[], []]
@@ -125,6 +130,12 @@ class ServerSubGroup:
         }
         self.send_to_node(data)
 
+    def update_senders(self):
+        # in hierarchical mode only the aggregator of every group sends the sum of its group's updates
+        if self.hierarchical:
+            return [min(group) for group in self.groupings]
+        return self.nodes
+
     def fl_update(self, node, data):
 
         for layer in data.keys():
@@ -137,8 +148,7 @@ class ServerSubGroup:
                 self.average_weights[layer][0] += temp_weight[0] / len(self.nodes)
                 self.average_weights[layer][1] += temp_weight[1] / len(self.nodes)
 
-        self.pending_nodes.remove(node)
-        if not self.pending_nodes:
+        if self.barrier.arrive('update', node):
             self.apply_updates()
 
     def apply_updates(self):
@@ -159,6 +169,7 @@ class ServerSubGroup:
             'round': self.round + 1,
             'accuracy': self.current_accuracy,
             'fl': self.end_time + self.grouping_time,
+            **self.barrier.latencies(),
         })
         self.end_round()
 
@@ -190,16 +201,16 @@ class ServerSubGroup:
         terminate_process_on_port(self.port)
 
     def start_assembly(self, port):
+        self.barrier.arrive('sharing', port)
         data = {
             "port": "SERVER",
             "message": MESSAGE_START_ASSEMBLY,
         }
         self.send_to_node(data, port=port)
 
-    def start_secret_sharing(self):
-        self.training_completed_count += 1
-        if self.training_completed_count == len(self.nodes):
-            self.training_completed_count = 0
+    def start_secret_sharing(self, port):
+        if self.barrier.arrive('training', port):
+            self.barrier.open('sharing', self.nodes)
             data = {
                 "port": "SERVER",
                 "message": MESSAGE_START_SECRET_SHARING,